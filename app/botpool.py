@@ -0,0 +1,86 @@
+import bisect
+import hashlib
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+
+from app.config import SETTINGS
+from app.delivery import ENGINE, DeliveryEngine
+from app.log import get_logger
+
+
+log = get_logger("pool")
+
+
+# ---------------------- Consistent Hashing ---------------------- #
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    حلقه‌ی consistent hashing: هر node با replicas نقطه‌ی مجازی روی حلقه.
+    با اضافه/کم‌شدن یک node فقط سهم همان node جابه‌جا می‌شود.
+    """
+
+    def __init__(self, nodes: list, replicas: int = 128):
+        ring = sorted((_hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [h for h, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def get(self, key):
+        i = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[i]
+
+
+# ---------------------- استخر ربات‌های ارسال ---------------------- #
+
+class BotPool:
+    """
+    ربات اصلی + ربات‌های ارسال اضافه (SENDER_TOKENS).
+    هر مقصد با consistent hashing همیشه به یک ربات می‌رسد و
+    هر ربات session و موتور ارسال (محدودیت نرخ) مخصوص خودش را دارد.
+    دریافت آپدیت‌ها فقط با ربات اصلی است.
+    ربات‌های ارسال باید عضو مقصدها و کانال‌های منبع باشند.
+    """
+
+    def __init__(self, replicas: int = 128):
+        self.replicas = replicas
+        self._senders: dict[int, tuple[Bot, DeliveryEngine]] = {}
+        self._ring: HashRing | None = None
+        self._primary: Bot | None = None
+
+    def start(self, primary: Bot, tokens: list[str] | None = None):
+        tokens = SETTINGS.SENDER_TOKENS if tokens is None else tokens
+
+        self._primary = primary
+        self._senders = {primary.id: (primary, ENGINE)}
+
+        for token in tokens:
+            # session جدا، با همان سرور API و proxy ربات اصلی
+            session = AiohttpSession(api=primary.session.api, proxy=SETTINGS.PROXY_URL or None)
+            bot = Bot(token=token, session=session)
+            if bot.id in self._senders:
+                continue
+            self._senders[bot.id] = (bot, DeliveryEngine())
+
+        self._ring = HashRing(list(self._senders), self.replicas)
+        log.info("sender bots ready", bots=len(self._senders))
+
+    @property
+    def bots(self) -> list[Bot]:
+        return [bot for bot, _ in self._senders.values()]
+
+    def route(self, chat_id: int) -> tuple[Bot, DeliveryEngine]:
+        """ربات و موتور ارسال مخصوص این مقصد."""
+        return self._senders[self._ring.get(chat_id)]
+
+    async def close(self):
+        for bot in self.bots:
+            if bot is not self._primary:
+                await bot.session.close()
+
+
+# استخر مشترک outbox و ویرایش کپی‌ها
+POOL = BotPool()
@@ -0,0 +1,37 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from app.config import SETTINGS
+
+
+# ---------------------- زمان محلی ربات ---------------------- #
+# «امروز» بر اساس TIMEZONE در .env محاسبه می‌شود (خالی → ساعت سیستم)
+
+_TZ = ZoneInfo(SETTINGS.TIMEZONE) if SETTINGS.TIMEZONE else None
+
+
+def now() -> datetime:
+    return datetime.now(_TZ)
+
+
+def today() -> date:
+    return now().date()
+
+
+def today_iso() -> str:
+    return today().isoformat()
+
+
+def days_ago_iso(days: int) -> str:
+    return (today() - timedelta(days=days)).isoformat()
+
+
+def seconds_until_midnight() -> float:
+    """
+    ثانیه تا نیمه‌شب بعدی به وقت محلی ربات.
+    تفریق datetimeهای هم‌منطقه ساعت دیواری را کم می‌کند و تغییر ساعت تابستانی را نمی‌بیند؛
+    پس هر دو به timestamp (UTC) تبدیل می‌شوند (بدون TIMEZONE → منطقه‌ی زمانی سیستم).
+    """
+    n = now()
+    midnight = datetime.combine(n.date() + timedelta(days=1), time(0), tzinfo=n.tzinfo)
+    return max(1.0, midnight.timestamp() - n.timestamp())
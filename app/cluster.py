@@ -0,0 +1,311 @@
+import asyncio
+import functools
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from app.botpool import HashRing, _hash
+from app.config import SETTINGS
+from app.events import CHANGES
+from app.log import get_logger
+from app.metrics import STORAGE_LATENCY
+from app.storage.aio import run as storage_run
+
+
+# ---------------------- جدول lease مشترک ---------------------- #
+# - cluster_workers → workerهای زنده با آخرین heartbeat
+# - cluster_leases  → مالک هر shard ("shard:N") و leader ("leader") تا expires_at
+#                    lease فقط وقتی به worker دیگری می‌رسد که مالکش آزادش کند یا منقضی شود
+# - cluster_topics  → شماره‌ی نسخه‌ی هر موضوع تغییرات (posts / dests / settings / admins / outbox)
+#                    تا کش بقیه‌ی workerها تازه شود
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cluster_workers (
+    id         TEXT PRIMARY KEY,
+    heartbeat  REAL NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_leases (
+    name       TEXT PRIMARY KEY,
+    owner      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cluster_topics (
+    topic TEXT PRIMARY KEY,
+    gen   INTEGER NOT NULL
+);
+"""
+
+CLAIM = """
+INSERT INTO cluster_leases(name, owner, expires_at) VALUES (?, ?, ?)
+ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+WHERE cluster_leases.owner = excluded.owner OR cluster_leases.expires_at <= ?
+"""
+
+# موضوع‌هایی که بین workerها هم‌گام می‌شوند
+# (outbox → jobی برای shard یک worker دیگر ذخیره شده است)
+TOPICS = ("posts", "dests", "settings", "admins", "outbox")
+
+log = get_logger("cluster")
+
+
+def shard_of(chat_id: int, shards: int) -> int:
+    return _hash(str(chat_id)) % shards
+
+
+class Cluster:
+    """
+    چند نسخه‌ی ربات روی یک SQLITE_PATH مشترک.
+    - هر worker با heartbeat در cluster_workers زنده می‌ماند
+    - shardهای مقصدها با consistent hashing بین workerهای زنده تقسیم می‌شوند
+      و هر shard فقط با lease خودش ارسال می‌شود (هیچ‌وقت دو مالک هم‌زمان)
+    - worker مرده بعد از lease_ttl حذف و shardهایش بین بقیه پخش می‌شود
+    - فقط leader (lease "leader") آپدیت‌ها را دریافت می‌کند
+    بدون CLUSTER_MODE همه‌چیز مال همین پروسه است.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.worker_id = ""
+        self.shards = 1
+        self.lease_ttl = 15.0
+
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._owned: frozenset[int] = frozenset()
+        self._expires = 0.0
+        self._leader = False
+        self._leader_changed = asyncio.Event()
+        self._gens: dict[str, int] = {}
+
+        # تراکنش‌های lease (با busy timeout) روی thread خودشان، نه روی event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cluster")
+
+    # ---- وضعیت ---- #
+    @property
+    def is_leader(self) -> bool:
+        return not self.enabled or self._leader
+
+    def owns(self, chat_id: int) -> bool:
+        """
+        آیا ارسال به این مقصد با این worker است؟
+        بعد از انقضای lease (heartbeat عقب افتاده) هیچ shardی مال این worker نیست
+        تا worker دیگری که lease را گرفته تنها فرستنده باشد.
+        """
+        if not self.enabled:
+            return True
+        return time.time() < self._expires and shard_of(chat_id, self.shards) in self._owned
+
+    def owned_shards(self) -> frozenset[int]:
+        return self._owned
+
+    # ---- دیتابیس ---- #
+    def _tx(self, fn):
+        with self._lock, STORAGE_LATENCY.time("cluster"):
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    async def _in_thread(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def _gen_snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute("SELECT topic, gen FROM cluster_topics").fetchall())
+
+    # ---- heartbeat و تقسیم shardها ---- #
+    def tick(self, now: float | None = None) -> bool:
+        """
+        heartbeat + حذف workerهای مرده + گرفتن/آزادکردن lease shardها و leader.
+        خروجی True یعنی shardهای این worker عوض شده‌اند.
+        (نسخه‌ی هم‌گام برای start؛ حلقه‌ی run تراکنش را در thread خوشه اجرا می‌کند)
+        """
+        now = now or time.time()
+        return self._apply(now, self._lease(now))
+
+    def _lease(self, now: float) -> tuple[frozenset[int], bool, int]:
+        me = self.worker_id
+        expires = now + self.lease_ttl
+
+        def step(db: sqlite3.Connection):
+            db.execute(
+                "INSERT INTO cluster_workers(id, heartbeat, started_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (me, now, now)
+            )
+            db.execute("DELETE FROM cluster_workers WHERE heartbeat <= ?", (now - self.lease_ttl,))
+            live = [r[0] for r in db.execute("SELECT id FROM cluster_workers")]
+
+            ring = HashRing(live)
+            want = {s for s in range(self.shards) if ring.get(s) == me}
+
+            # سهم قبلی که دیگر مال ما نیست آزاد می‌شود تا مالک جدید فوراً بگیرد
+            for (name,) in db.execute(
+                "SELECT name FROM cluster_leases WHERE owner = ? AND name LIKE 'shard:%'", (me,)
+            ).fetchall():
+                if int(name[6:]) not in want:
+                    db.execute("DELETE FROM cluster_leases WHERE name = ? AND owner = ?", (name, me))
+
+            for s in want:
+                db.execute(CLAIM, (f"shard:{s}", me, expires, now))
+            db.execute(CLAIM, ("leader", me, expires, now))
+
+            owned = frozenset(
+                int(r[0][6:]) for r in db.execute(
+                    "SELECT name FROM cluster_leases "
+                    "WHERE owner = ? AND expires_at > ? AND name LIKE 'shard:%'",
+                    (me, now)
+                )
+            )
+            leader = db.execute(
+                "SELECT 1 FROM cluster_leases WHERE name = 'leader' AND owner = ?", (me,)
+            ).fetchone() is not None
+            return owned, leader, len(live)
+
+        return self._tx(step)
+
+    def _apply(self, now: float, lease: tuple[frozenset[int], bool, int]) -> bool:
+        """نتیجه‌ی تراکنش lease روی event loop اعمال می‌شود (Event ها thread-safe نیستند)."""
+        owned, leader, live = lease
+        me = self.worker_id
+
+        changed = owned != self._owned
+        if changed:
+            log.info("shards rebalanced", worker=me, shards=len(owned), total=self.shards, live_workers=live)
+        self._owned = owned
+        # leaseها از زمان شروع تراکنش تا lease_ttl معتبرند
+        self._expires = now + self.lease_ttl
+
+        if leader != self._leader:
+            log.info("leader" if leader else "follower", worker=me)
+            self._leader = leader
+            self._leader_changed.set()
+
+        return changed
+
+    # ---- هم‌گام‌سازی کش‌ها ---- #
+    def bump(self, topics: set[str]):
+        """اعلان تغییر محلی به بقیه‌ی workerها."""
+        def step(db: sqlite3.Connection):
+            before = dict(db.execute("SELECT topic, gen FROM cluster_topics").fetchall())
+            for t in topics:
+                db.execute(
+                    "INSERT INTO cluster_topics(topic, gen) VALUES (?, 1) "
+                    "ON CONFLICT(topic) DO UPDATE SET gen = gen + 1",
+                    (t,)
+                )
+            return before
+
+        before = self._tx(step)
+        # تغییر خود ما دوباره بارگذاری نمی‌شود
+        # (مگر worker دیگری هم در همین فاصله تغییری داده باشد)
+        for t in topics:
+            if before.get(t, 0) == self._gens.get(t, 0):
+                self._gens[t] = before.get(t, 0) + 1
+
+    def remote_changes(self) -> set[str]:
+        """موضوع‌هایی که workerهای دیگر از آخرین بررسی تغییر داده‌اند."""
+        gens = self._gen_snapshot()
+        changed = {t for t, g in gens.items() if g != self._gens.get(t, 0)}
+        self._gens.update(gens)
+        return changed
+
+    # ---- شروع / توقف ---- #
+    def start(self, path: Path | None = None, worker_id: str | None = None,
+              shards: int | None = None, lease_ttl: float | None = None):
+        """ثبت worker و گرفتن اولین سهم (قبل از بارگذاری outbox)."""
+        path = path or Path(SETTINGS.SQLITE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.worker_id = worker_id or SETTINGS.WORKER_ID
+        self.shards = shards or SETTINGS.CLUSTER_SHARDS
+        self.lease_ttl = lease_ttl or SETTINGS.CLUSTER_LEASE_TTL
+
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        self.enabled = True
+        self._gens = self._gen_snapshot()
+        self.tick()
+
+    async def run(self, reload: dict[str, Callable[[], None]],
+                  on_sync: Callable[[bool, set[str]], Awaitable] | None = None):
+        """
+        حلقه‌ی heartbeat (هر lease_ttl/3 ثانیه).
+        reload → topic -> تابع بارگذاری دوباره‌ی کش همان موضوع
+        on_sync(rebalanced, remote) → بعد از هر heartbeat با موضوع‌هایی که بقیه تغییر داده‌اند
+        (مثلاً برداشتن jobهای shardهای این worker)
+        """
+        changes = CHANGES.subscribe()
+        # اعلان‌هایی که خودمان بعد از بارگذاری دوباره منتشر کرده‌ایم
+        echo: set[str] = set()
+
+        while True:
+            topics = await changes.wait(self.lease_ttl / 3)
+
+            try:
+                local = (topics & set(TOPICS)) - echo
+                echo.clear()
+                if local:
+                    await self._in_thread(self.bump, local)
+
+                remote = await self._in_thread(self.remote_changes)
+                for t in remote:
+                    if t in reload:
+                        await storage_run(reload[t])
+
+                now = time.time()
+                rebalanced = self._apply(now, await self._in_thread(self._lease, now))
+                if rebalanced:
+                    remote.add("dests")
+
+                if on_sync is not None:
+                    await on_sync(rebalanced, remote)
+
+                for t in remote:
+                    echo.add(t)
+                    CHANGES.publish(t)
+            except Exception as e:
+                log.exception("heartbeat failed", error=type(e).__name__)
+
+    async def wait_leader(self, leader: bool = True):
+        """صبر تا این worker leader شود (یا با leader=False، تا leader نبودنش)."""
+        while self.is_leader != leader:
+            self._leader_changed.clear()
+            await self._leader_changed.wait()
+
+    def leave(self):
+        """خروج مرتب: آزادکردن leaseها تا بقیه بدون صبر برای TTL سهم را بگیرند."""
+        if not self.enabled:
+            return
+
+        def step(db: sqlite3.Connection):
+            db.execute("DELETE FROM cluster_leases WHERE owner = ?", (self.worker_id,))
+            db.execute("DELETE FROM cluster_workers WHERE id = ?", (self.worker_id,))
+
+        try:
+            self._tx(step)
+        except Exception as e:
+            log.warning("leave failed", error=type(e).__name__, detail=str(e))
+
+        # enabled می‌ماند → بعد از خروج هیچ مقصدی مال این پروسه نیست
+        self._owned = frozenset()
+        self._leader = False
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+
+# عضویت این پروسه در خوشه
+CLUSTER = Cluster()
@@ -1,4 +1,6 @@
 import os
+import secrets
+import socket
 from dataclasses import dataclass, field
 
 from dotenv import load_dotenv
@@ -24,8 +26,37 @@ class Settings:
 
     SOURCE_CHANNEL_ID: int = field(default_factory=lambda: int(os.getenv("SOURCE_CHANNEL_ID", "0") or "0"))
 
+    # کانال‌های منبع دیگر (با کاما)؛ SOURCE_CHANNEL_ID همیشه منبع پیش‌فرض است.
+    # هر مقصد با فیلد sources مشخص می‌کند از کدام منبع‌ها پست بگیرد.
+    SOURCE_CHANNEL_IDS: set[int] = field(default_factory=lambda: {
+        int(x)
+        for x in (os.getenv("SOURCE_CHANNEL_IDS") or "").replace(" ", "").split(",")
+        if x
+    })
+
     PROXY_URL: str = field(default_factory=lambda: (os.getenv("PROXY_URL") or "").strip())
 
+    # توکن ربات‌های ارسال اضافه (با کاما) — مقصدها بین ربات اصلی و این‌ها تقسیم می‌شوند
+    SENDER_TOKENS: list[str] = field(default_factory=lambda: [
+        x.strip()
+        for x in (os.getenv("SENDER_TOKENS") or "").split(",")
+        if x.strip()
+    ])
+
+    # ---------------------- دریافت آپدیت‌ها ---------------------- #
+    # polling → long-poll (پیش‌فرض)
+    # webhook → روی همان وب‌سرور healthcheck و همان PORT
+    UPDATE_MODE: str = field(default_factory=lambda: (os.getenv("UPDATE_MODE") or "polling").strip().lower())
+
+    # آدرس عمومی ربات (مثلاً https://bot.example.com) — فقط در حالت webhook
+    WEBHOOK_URL: str = field(default_factory=lambda: (os.getenv("WEBHOOK_URL") or "").strip().rstrip("/"))
+
+    WEBHOOK_PATH: str = field(default_factory=lambda: (os.getenv("WEBHOOK_PATH") or "/webhook").strip())
+
+    # مقدار هدر X-Telegram-Bot-Api-Secret-Token؛ اگر خالی باشد در هر اجرا ساخته می‌شود
+    # (در حالت خوشه الزامی است: همه‌ی workerها باید یک secret داشته باشند)
+    WEBHOOK_SECRET: str = field(default_factory=lambda: (os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)).strip())
+
     # ---------------------- تنظیمات ارسال ---------------------- #
     # حالت ارسال:
     # - repeat  → ارسال دوره‌ای توسط Scheduler
@@ -35,6 +66,84 @@ class Settings:
     # فاصله پیش‌فرض در حالت ارسال دوره‌ای (ثانیه)
     DEFAULT_INTERVAL: int = 60 * 30
 
+    # حداکثر فراخوانی هم‌زمان API در هر چرخه‌ی ارسال
+    SEND_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("SEND_CONCURRENCY", "20") or "20"))
+
+    # محدودیت‌های تلگرام: پیام در ثانیه (کل ربات) و پیام در دقیقه (هر گروه)
+    GLOBAL_RATE: float = field(default_factory=lambda: float(os.getenv("GLOBAL_RATE", "30") or "30"))
+    CHAT_RATE_PER_MIN: float = field(default_factory=lambda: float(os.getenv("CHAT_RATE_PER_MIN", "20") or "20"))
+
+    # ارسال یکنواخت: هر ارسال زمان مخصوص خودش را در طول interval می‌گیرد
+    # (به‌جای ارسال همه با هم در ابتدای هر چرخه)
+    SMOOTH_SEND: bool = field(default_factory=lambda: (os.getenv("SMOOTH_SEND") or "0").strip().lower() in ("1", "true", "yes"))
+
+    # سقف نرخ یکنواخت (ارسال در ثانیه برای کل ربات) — 0 یعنی بدون سقف
+    TARGET_RATE: float = field(default_factory=lambda: float(os.getenv("TARGET_RATE", "0") or "0"))
+
+    # حداکثر تعداد تلاش برای هر ارسال در صف (outbox)
+    OUTBOX_MAX_ATTEMPTS: int = field(default_factory=lambda: int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5") or "5"))
+
+    # ---------------------- تنظیمات ذخیره‌سازی ---------------------- #
+    # json   → فایل‌های JSON قبلی (پیش‌فرض)
+    # sqlite → یک فایل SQLite با ایندکس (مهاجرت خودکار از JSON)
+    STORAGE_BACKEND: str = field(default_factory=lambda: (os.getenv("STORAGE_BACKEND") or "json").strip().lower())
+
+    SQLITE_PATH: str = field(default_factory=lambda: (os.getenv("SQLITE_PATH") or "storage/forwardbot.db").strip())
+
+    # منطقه‌ی زمانی برای «پست‌های امروز» و جابه‌جایی نیمه‌شب (مثلاً Asia/Tehran)
+    TIMEZONE: str = field(default_factory=lambda: (os.getenv("TIMEZONE") or "").strip())
+
+    # چند روز آخر پست‌ها در حافظه و فایل‌های روزانه می‌مانند
+    POSTS_RETENTION_DAYS: int = field(default_factory=lambda: int(os.getenv("POSTS_RETENTION_DAYS", "7") or "7"))
+
+    # روزهای قدیمی‌تر: gzip → فشرده در آرشیو ، delete → حذف کامل
+    POSTS_ARCHIVE: str = field(default_factory=lambda: (os.getenv("POSTS_ARCHIVE") or "gzip").strip().lower())
+
+    # فایل‌های JSON حداکثر هر چند میلی‌ثانیه یک‌بار روی دیسک نوشته می‌شوند
+    STORAGE_FLUSH_MS: int = field(default_factory=lambda: int(os.getenv("STORAGE_FLUSH_MS", "500") or "500"))
+
+    # ---------------------- حالت گفتگو (FSM) ---------------------- #
+    # memory → درون حافظه ، sqlite → در SQLITE_PATH (مشترک بین چند پروسه)
+    FSM_STORAGE: str = field(default_factory=lambda: (os.getenv("FSM_STORAGE") or "memory").strip().lower())
+
+    # ورودی بی‌استفاده بعد از چند ثانیه منقضی می‌شود
+    FSM_TTL: int = field(default_factory=lambda: int(os.getenv("FSM_TTL", "900") or "900"))
+
+    # حداکثر تعداد حالت‌های نگه‌داشته‌شده (قدیمی‌ترین‌ها حذف می‌شوند)
+    FSM_MAX_ENTRIES: int = field(default_factory=lambda: int(os.getenv("FSM_MAX_ENTRIES", "10000") or "10000"))
+
+    # ---------------------- حالت خوشه (چند پروسه) ---------------------- #
+    # چند نسخه‌ی main.py با یک SQLITE_PATH مشترک:
+    # مقصدها بین workerهای زنده تقسیم می‌شوند و فقط leader آپدیت دریافت می‌کند.
+    CLUSTER_MODE: bool = field(default_factory=lambda: (os.getenv("CLUSTER_MODE") or "0").strip().lower() in ("1", "true", "yes"))
+
+    # شناسه‌ی این worker (پیش‌فرض: hostname:pid)
+    WORKER_ID: str = field(default_factory=lambda: (os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}").strip())
+
+    # تعداد shardهای مقصدها (در همه‌ی workerها باید یکی باشد)
+    CLUSTER_SHARDS: int = field(default_factory=lambda: int(os.getenv("CLUSTER_SHARDS", "64") or "64"))
+
+    # worker بدون heartbeat بعد از چند ثانیه مرده حساب می‌شود و سهمش پخش می‌شود
+    CLUSTER_LEASE_TTL: int = field(default_factory=lambda: int(os.getenv("CLUSTER_LEASE_TTL", "15") or "15"))
+
+    # ---------------------- لاگ ---------------------- #
+    # رکوردهای JSON روی stdout؛ نوشتن در thread جدا (از طریق صف)
+    LOG_LEVEL: str = field(default_factory=lambda: (os.getenv("LOG_LEVEL") or "INFO").strip().upper())
+
+    # سطح هر زیرسیستم (مثلاً outbox=DEBUG,scheduler=WARNING)
+    LOG_LEVELS: dict[str, str] = field(default_factory=lambda: {
+        name.strip().lower(): level.strip().upper()
+        for name, _, level in (
+            x.partition("=") for x in (os.getenv("LOG_LEVELS") or "").split(",") if "=" in x
+        )
+    })
+
+    # سهم لاگ‌های پرتعداد موفقیت (هر ارسال) که نوشته می‌شود — 1 یعنی همه
+    LOG_SAMPLE: float = field(default_factory=lambda: float(os.getenv("LOG_SAMPLE", "0.1") or "0.1"))
+
+    # سقف صف لاگ؛ وقتی پر باشد رکورد جدید دور ریخته می‌شود (ارسال هیچ‌وقت منتظر لاگ نمی‌ماند)
+    LOG_QUEUE_SIZE: int = field(default_factory=lambda: int(os.getenv("LOG_QUEUE_SIZE", "10000") or "10000"))
+
 
 # ایجاد شی تنظیمات
 SETTINGS = Settings()
@@ -49,6 +158,16 @@ def build_bot_and_dispatcher():
     if not SETTINGS.BOT_TOKEN:
         raise RuntimeError("❗ BOT_TOKEN در فایل .env تنظیم نشده است.")
 
+    if SETTINGS.UPDATE_MODE == "webhook" and not SETTINGS.WEBHOOK_URL:
+        raise RuntimeError("❗ در حالت webhook مقدار WEBHOOK_URL باید تنظیم شود.")
+
+    if SETTINGS.CLUSTER_MODE and SETTINGS.STORAGE_BACKEND != "sqlite":
+        raise RuntimeError("❗ حالت خوشه به STORAGE_BACKEND=sqlite (فایل مشترک) نیاز دارد.")
+
+    # secret تصادفی در هر پروسه فرق دارد → webhook ثبت‌شده توسط یک worker درخواست‌های بقیه را رد می‌کند
+    if SETTINGS.CLUSTER_MODE and SETTINGS.UPDATE_MODE == "webhook" and not os.getenv("WEBHOOK_SECRET"):
+        raise RuntimeError("❗ در حالت خوشه با webhook مقدار WEBHOOK_SECRET باید در .env تنظیم شود (برای همه‌ی workerها یکسان).")
+
     # Proxy (در صورت نیاز)
     session = None
     if SETTINGS.PROXY_URL:
@@ -56,8 +175,11 @@ def build_bot_and_dispatcher():
 
     # ساخت Bot و Dispatcher
     bot = Bot(token=SETTINGS.BOT_TOKEN, session=session)
-    dp = Dispatcher()
 
-    print("[CONFIG] Bot & Dispatcher created successfully.")
+    from app.storage.fsm import build_fsm_storage
+    dp = Dispatcher(storage=build_fsm_storage())
+
+    from app.log import get_logger
+    get_logger("config").info("bot and dispatcher created")
 
     return bot, dp, SETTINGS
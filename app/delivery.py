@@ -0,0 +1,86 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.config import SETTINGS
+from app.log import get_logger
+from app.ratelimit import TokenBucket
+
+log = get_logger("delivery")
+
+
+# ---------------------- موتور ارسال ---------------------- #
+
+class DeliveryEngine:
+    """
+    ارسال هم‌زمان با رعایت محدودیت‌های تلگرام:
+    - یک bucket سراسری (حدود 30 پیام در ثانیه برای کل ربات)
+    - یک bucket برای هر چت (حدود 20 پیام در دقیقه برای هر گروه)
+    - TelegramRetryAfter → توقف همان چت و تلاش دوباره
+    """
+
+    def __init__(
+        self,
+        concurrency: int = SETTINGS.SEND_CONCURRENCY,
+        global_rate: float = SETTINGS.GLOBAL_RATE,
+        chat_rate_per_min: float = SETTINGS.CHAT_RATE_PER_MIN,
+        max_retries: int = 3,
+    ):
+        self.concurrency = concurrency
+        self.chat_rate_per_min = chat_rate_per_min
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate_per_min / 60, self.chat_rate_per_min)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def burst(self, chat_id: int) -> int:
+        """بیشترین تعداد پیامی که یک فراخوانی بدون بدهی به bucketها می‌فرستد."""
+        return max(1, int(min(self._chat_bucket(chat_id).capacity, self._global.capacity)))
+
+    async def call(self, chat_id: int, fn: Callable[[], Awaitable], cost: int = 1):
+        """
+        اجرای یک فراخوانی API برای chat_id با رعایت هر دو محدودیت.
+        cost → تعداد پیامی که این فراخوانی می‌فرستد (برای copyMessages).
+        خطاهای غیر از RetryAfter به فراخواننده برگردانده می‌شوند.
+        """
+        bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire(cost)
+            await self._global.acquire(cost)
+
+            try:
+                return await fn()
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+
+                log.warning("retry after", dest=chat_id, retry_after=e.retry_after)
+                bucket.pause(e.retry_after)
+
+    async def run(self, jobs: Iterable[tuple[int, Callable[[], Awaitable]]]):
+        """
+        اجرای همه‌ی jobها (chat_id, fn) با حداکثر concurrency فراخوانی هم‌زمان.
+        """
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def _one(chat_id, fn):
+            async with sem:
+                try:
+                    await self.call(chat_id, fn)
+                except Exception as e:
+                    log.warning("call failed", dest=chat_id, error=type(e).__name__, detail=str(e))
+
+        await asyncio.gather(*(_one(chat_id, fn) for chat_id, fn in jobs))
+
+
+# موتور مشترک scheduler و ارسال یکبار
+ENGINE = DeliveryEngine()
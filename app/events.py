@@ -0,0 +1,75 @@
+import asyncio
+
+
+# ---------------------- کانال اعلان تغییرات ---------------------- #
+
+class Subscription:
+    """
+    یک شنونده روی کانال تغییرات.
+    موضوع‌های رسیده تا فراخوانی بعدی wait جمع می‌شوند.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._topics: set[str] = set()
+
+    def _push(self, topic: str):
+        self._topics.add(topic)
+        self._event.set()
+
+    async def wait(self, timeout: float | None = None) -> set[str]:
+        """
+        صبر تا رسیدن تغییر یا تمام‌شدن timeout.
+        خروجی: موضوع‌هایی که تغییر کرده‌اند (خالی یعنی timeout).
+        """
+        if not self._event.is_set():
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        topics, self._topics = self._topics, set()
+        self._event.clear()
+        return topics
+
+
+class ChangeBus:
+    """
+    اعلان تغییرات داخلی ربات:
+    - settings → حالت ارسال یا interval
+    - posts    → پست جدید یا روشن/خاموش شدن پست
+    - dests    → افزودن / حذف / تغییر مقصد
+    - admins   → افزودن / حذف ادمین
+    """
+
+    def __init__(self):
+        self._subs: list[Subscription] = []
+
+    def subscribe(self) -> Subscription:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        sub = Subscription(loop)
+        self._subs.append(sub)
+        return sub
+
+    def publish(self, topic: str):
+        """
+        از هر thread قابل فراخوانی است (مثلاً thread ذخیره‌سازی در app.storage.aio).
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        for sub in self._subs:
+            if sub._loop is None or sub._loop is running:
+                sub._push(topic)
+            else:
+                sub._loop.call_soon_threadsafe(sub._push, topic)
+
+
+CHANGES = ChangeBus()
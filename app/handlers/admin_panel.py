@@ -1,23 +1,40 @@
+from typing import Any, Awaitable, Callable
+
 from aiogram import Router, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
 
+from app import profiler
+from app.botpool import POOL
 from app.config import SETTINGS
-from app.storage.dests import add_destination, remove_destination, list_destinations
-from app.storage.posts import list_today_posts, toggle_post
-
-from settings_storage import (
+from app.metrics import HANDLER_LATENCY
+from app.middlewares import AdminOnlyMiddleware
+from app.storage.admins import is_admin
+from app.storage.dests import configured_sources
+from app.storage.aio import (
+    add_admin,
+    remove_admin,
+    list_admins,
+    add_destination,
+    remove_destination,
+    list_destinations,
+    update_destination,
+    list_quarantined,
+    reinstate_destination,
+    list_sources,
+    set_destination_sources,
+    list_today_posts,
+    toggle_post,
     get_send_mode,
     set_send_mode,
-    get_interval,
-    set_interval_value
+    set_interval_value,
 )
 
 router = Router()
 
-# -------------------- تشخیص ادمین -------------------- #
-
-def is_admin(uid: int) -> bool:
-    return uid == SETTINGS.OWNER_ID or uid in SETTINGS.ADMIN_IDS
+# همه‌ی هندلرهای این روتر فقط برای ادمین‌ها (قبل از اجرای هندلر بررسی می‌شود)
+router.message.middleware(AdminOnlyMiddleware(is_admin))
+router.callback_query.middleware(AdminOnlyMiddleware(is_admin))
 
 
 # -------------------- Reply Keyboards -------------------- #
@@ -46,6 +63,7 @@ def dests_keyboard():
                 types.KeyboardButton(text="📋 لیست مقصدها"),
             ],
             [
+                types.KeyboardButton(text="🚫 مقصدهای قرنطینه"),
                 types.KeyboardButton(text="🔙 بازگشت")
             ]
         ],
@@ -80,21 +98,44 @@ def interval_unit_keyboard():
     )
 
 
-# -------------------- حالت‌های انتظار برای ورودی -------------------- #
+# -------------------- جدول مسیریابی و حالت کاربران -------------------- #
+# به‌جای زنجیره‌ی فیلترها، هر پیام با یک جستجوی dict به هندلرش می‌رسد:
+# - BUTTONS → متن دقیق دکمه -> هندلر
+# - STATES  → نام حالت -> هندلر ورودی آن حالت
+# حالت هر کاربر در FSM storage دیسپچر است (app/storage/fsm.py → با TTL و سقف)
+
+Handler = Callable[..., Awaitable[Any]]
+
+BUTTONS: dict[str, Handler] = {}
+STATES: dict[str, Handler] = {}
+
 
-ADD_DEST_WAIT = set()
-DEL_DEST_WAIT = set()
+def button(*texts: str):
+    """ثبت هندلر برای یک یا چند دکمه‌ی کیبورد."""
+    def deco(fn: Handler) -> Handler:
+        for text in texts:
+            BUTTONS[text] = fn
+        return fn
+    return deco
 
-SENDMODE_STATE = {}   # user_id -> state
-SENDMODE_UNIT = {}    # user_id -> "s" / "m" / "h"
+
+def on_state(name: str):
+    """ثبت هندلر ورودی کاربری که در حالت name است."""
+    def deco(fn: Handler) -> Handler:
+        STATES[name] = fn
+        return fn
+    return deco
+
+
+async def set_state(state: FSMContext, name: str, **data: Any):
+    await state.set_state(name)
+    await state.set_data(data)
 
 
 # -------------------- /admin -------------------- #
 
 @router.message(Command("admin"))
 async def admin_start(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return await message.answer("⛔ شما ادمین نیستید.")
     return await message.answer("🔧 پنل مدیریت ربات", reply_markup=admin_keyboard())
 
 
@@ -116,8 +157,8 @@ def extract_chat(text: str):
     return None, None
 
 
-@router.message(F.text == "📍 مدیریت مقصدها")
-async def menu_dest(message: types.Message):
+@button("📍 مدیریت مقصدها")
+async def menu_dest(message: types.Message, state: FSMContext):
     return await message.answer(
         "📍 <b>مدیریت مقصدها</b>",
         parse_mode="HTML",
@@ -127,29 +168,28 @@ async def menu_dest(message: types.Message):
 
 # -------------------- افزودن مقصد -------------------- #
 
-@router.message(F.text == "➕ افزودن مقصد")
-async def ask_add_dest(message: types.Message):
-    ADD_DEST_WAIT.add(message.from_user.id)
+@button("➕ افزودن مقصد")
+async def ask_add_dest(message: types.Message, state: FSMContext):
+    await set_state(state, "add_dest")
     return await message.answer(
         "chat_id یا لینک گروه را ارسال کنید:",
         parse_mode="HTML"
     )
 
 
-@router.message(F.text, F.from_user.id.func(lambda uid: uid in ADD_DEST_WAIT))
-async def handle_add_dest(message: types.Message):
-    uid = message.from_user.id
-    ADD_DEST_WAIT.remove(uid)
-
+@on_state("add_dest")
+async def handle_add_dest(message: types.Message, state: FSMContext, data: dict):
     raw = message.text.strip()
     chat_id, username = extract_chat(raw)
 
+    # دسترسی با همان رباتی بررسی می‌شود که به این مقصد ارسال می‌کند (استخر ربات‌ها)
+
     # حالت chat_id
     if chat_id:
         try:
-            chat = await message.bot.get_chat(chat_id)
+            chat = await POOL.route(chat_id)[0].get_chat(chat_id)
             title = chat.title or "گروه"
-            add_destination(chat_id, title)
+            await add_destination(chat_id, title)
             return await message.answer(f"✅ مقصد اضافه شد: {title}", reply_markup=dests_keyboard())
         except:
             return await message.answer("❗ ربات به مقصد دسترسی ندارد.", reply_markup=dests_keyboard())
@@ -157,10 +197,10 @@ async def handle_add_dest(message: types.Message):
     # حالت username
     if username:
         try:
-            chat = await message.bot.get_chat(username)
-            cid = chat.id
+            cid = (await message.bot.get_chat(username)).id
+            chat = await POOL.route(cid)[0].get_chat(cid)
             title = chat.title or "گروه"
-            add_destination(cid, title)
+            await add_destination(cid, title)
             return await message.answer(f"✅ مقصد اضافه شد: {title}", reply_markup=dests_keyboard())
         except:
             return await message.answer("❗ ربات به مقصد دسترسی ندارد.", reply_markup=dests_keyboard())
@@ -170,23 +210,20 @@ async def handle_add_dest(message: types.Message):
 
 # -------------------- حذف مقصد -------------------- #
 
-@router.message(F.text == "🗑 حذف مقصد")
-async def ask_del(message: types.Message):
-    DEL_DEST_WAIT.add(message.from_user.id)
+@button("🗑 حذف مقصد")
+async def ask_del(message: types.Message, state: FSMContext):
+    await set_state(state, "del_dest")
     return await message.answer("chat_id مقصد را ارسال کنید:", parse_mode="HTML")
 
 
-@router.message(F.text, F.from_user.id.func(lambda uid: uid in DEL_DEST_WAIT))
-async def do_del(message: types.Message):
-    uid = message.from_user.id
-    DEL_DEST_WAIT.remove(uid)
-
+@on_state("del_dest")
+async def do_del(message: types.Message, state: FSMContext, data: dict):
     try:
         cid = int(message.text.strip())
     except:
         return await message.answer("❗ فرمت اشتباه.", reply_markup=dests_keyboard())
 
-    ok = remove_destination(cid)
+    ok = await remove_destination(cid)
     return await message.answer(
         "🗑 حذف شد." if ok else "❗ مقصد یافت نشد.",
         reply_markup=dests_keyboard()
@@ -195,9 +232,9 @@ async def do_del(message: types.Message):
 
 # -------------------- لیست مقصدها -------------------- #
 
-@router.message(F.text == "📋 لیست مقصدها")
-async def list_destinations_handler(message: types.Message):
-    dests = list_destinations()
+@button("📋 لیست مقصدها")
+async def list_destinations_handler(message: types.Message, state: FSMContext):
+    dests = await list_destinations()
 
     if not dests:
         return await message.answer("❗ هنوز هیچ مقصدی ثبت نشده.", reply_markup=dests_keyboard())
@@ -211,40 +248,223 @@ async def list_destinations_handler(message: types.Message):
         internal = str(cid).replace("-100", "")
         link = f"https://t.me/c/{internal}/1"
 
-        txt += f"{i}. <a href=\"{link}\">{title}</a>\n"
+        txt += f"{i}. <a href=\"{link}\">{title}</a>"
+        if d.get("interval"):
+            txt += f" ⏱ {d['interval']}s"
+        if d.get("sources"):
+            txt += " ⬅️ " + "، ".join(f"<code>{s}</code>" for s in d["sources"])
+        if (d.get("health") or {}).get("quarantined"):
+            txt += " 🚫"
+        txt += "\n"
 
     return await message.answer(txt, parse_mode="HTML", reply_markup=dests_keyboard())
 
 
+# -------------------- مقصدهای قرنطینه -------------------- #
+
+@button("🚫 مقصدهای قرنطینه")
+async def quarantined_handler(message: types.Message, state: FSMContext):
+    dests = await list_quarantined()
+
+    if not dests:
+        return await message.answer("✅ هیچ مقصدی در قرنطینه نیست.", reply_markup=dests_keyboard())
+
+    for d in dests:
+        h = d.get("health") or {}
+        text = (
+            f"🚫 <b>{d.get('title') or 'گروه'}</b>\n"
+            f"<code>{d['chat_id']}</code>\n"
+            f"خطا: {h.get('error', '-')} — {h.get('detail', '')}\n"
+            f"خطاهای پشت‌سرهم: {h.get('failures', 0)}"
+        )
+
+        kb = types.InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    types.InlineKeyboardButton(
+                        text="♻️ فعال‌سازی دوباره",
+                        callback_data=f"reinstate:{d['chat_id']}"
+                    )
+                ]
+            ]
+        )
+
+        await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("reinstate:"))
+async def reinstate_handler(query: types.CallbackQuery):
+    chat_id = int(query.data.split(":")[1])
+
+    if not await reinstate_destination(chat_id):
+        return await query.answer("❗ مقصد در قرنطینه نیست.", show_alert=True)
+
+    await query.answer("♻️ مقصد دوباره فعال شد.")
+    await query.message.edit_reply_markup(reply_markup=None)
+
+
+# -------------------- interval مخصوص هر مقصد -------------------- #
+
+@router.message(Command("dest_interval"))
+async def dest_interval_handler(message: types.Message, command: CommandObject):
+    """
+    /dest_interval <chat_id> <ثانیه>
+    مقدار 0 → برگشت به interval عمومی
+    """
+    try:
+        cid, sec = (int(x) for x in (command.args or "").split())
+    except:
+        return await message.answer("❗ فرمت: /dest_interval chat_id ثانیه")
+
+    ok = await update_destination(cid, interval=sec or None)
+    if not ok:
+        return await message.answer("❗ مقصد یافت نشد.")
+
+    return await message.answer(
+        f"⏱ فاصله‌ی این مقصد روی <b>{sec}</b> ثانیه تنظیم شد." if sec else "⏱ فاصله‌ی عمومی برای این مقصد فعال شد.",
+        parse_mode="HTML"
+    )
+
+
+# -------------------- منبع‌ها و مسیریابی -------------------- #
+
+@router.message(Command("route"))
+async def route_handler(message: types.Message, command: CommandObject):
+    """
+    /route <chat_id مقصد> <source_id,source_id,...>
+    /route <chat_id مقصد> default → فقط منبع پیش‌فرض
+    """
+    try:
+        raw_cid, raw_sources = (command.args or "").split(maxsplit=1)
+        cid = int(raw_cid)
+        sources = [] if raw_sources.strip() == "default" else [
+            int(x) for x in raw_sources.replace(" ", "").split(",") if x
+        ]
+    except:
+        return await message.answer("❗ فرمت: /route chat_id source_id,source_id")
+
+    # فقط منبع‌های تنظیم‌شده (SOURCE_CHANNEL_ID / SOURCE_CHANNEL_IDS)
+    allowed = configured_sources()
+    unknown = [s for s in sources if s not in allowed]
+    if unknown:
+        return await message.answer(
+            "❗ منبع تنظیم‌نشده: " + "، ".join(f"<code>{s}</code>" for s in unknown)
+            + "\nمنبع‌های مجاز: " + "، ".join(f"<code>{s}</code>" for s in sorted(allowed)),
+            parse_mode="HTML"
+        )
+
+    if not await set_destination_sources(cid, sources):
+        return await message.answer("❗ مقصد یافت نشد.")
+
+    return await message.answer(
+        "🔀 منبع‌های این مقصد: " + ("، ".join(f"<code>{s}</code>" for s in sources) or "پیش‌فرض"),
+        parse_mode="HTML"
+    )
+
+
+@router.message(Command("sources"))
+async def sources_handler(message: types.Message):
+    txt = "<b>🔀 جدول مسیریابی</b>\n\n"
+
+    for source, chats in sorted((await list_sources()).items()):
+        default = " (پیش‌فرض)" if source == SETTINGS.SOURCE_CHANNEL_ID else ""
+        txt += f"<code>{source}</code>{default} → {len(chats)} مقصد\n"
+
+    return await message.answer(txt, parse_mode="HTML")
+
+
+# -------------------- مدیریت ادمین‌ها (فقط Owner) -------------------- #
+
+@router.message(Command("addadmin", "deladmin"))
+async def manage_admin_handler(message: types.Message, command: CommandObject):
+    """
+    /addadmin <user_id>  ،  /deladmin <user_id>
+    """
+    if message.from_user.id != SETTINGS.OWNER_ID:
+        return await message.answer("⛔ فقط مالک ربات می‌تواند ادمین‌ها را تغییر دهد.")
+
+    try:
+        uid = int((command.args or "").strip())
+    except:
+        return await message.answer(f"❗ فرمت: /{command.command} user_id")
+
+    if command.command == "addadmin":
+        ok = await add_admin(uid)
+        return await message.answer("✔ ادمین اضافه شد." if ok else "⚠️ این کاربر از قبل ادمین است.")
+
+    ok = await remove_admin(uid)
+    return await message.answer("🗑 ادمین حذف شد." if ok else "❗ این کاربر ادمین نیست.")
+
+
+@router.message(Command("admins"))
+async def list_admins_handler(message: types.Message):
+    admins = await list_admins()
+    text = "👤 <b>ادمین‌ها:</b>\n\n" + "\n".join(f"• <code>{uid}</code>" for uid in admins)
+    return await message.answer(text, parse_mode="HTML")
+
+
+# -------------------- پروفایل (فقط Owner) -------------------- #
+
+@router.message(Command("profile"))
+async def profile_handler(message: types.Message, command: CommandObject):
+    """
+    /profile <ثانیه>
+    cProfile روی پروسه‌ی زنده؛ پرهزینه‌ترین توابع به‌صورت فایل برمی‌گردد.
+    """
+    if message.from_user.id != SETTINGS.OWNER_ID:
+        return await message.answer("⛔ فقط مالک ربات می‌تواند پروفایل بگیرد.")
+
+    try:
+        seconds = int((command.args or "").strip())
+    except:
+        return await message.answer(f"❗ فرمت: /profile ثانیه (حداکثر {profiler.MAX_SECONDS})")
+
+    if profiler.is_running():
+        return await message.answer("⏳ یک پروفایل دیگر در حال اجراست.")
+
+    seconds = max(1, min(seconds, profiler.MAX_SECONDS))
+    await message.answer(f"🔬 پروفایل به مدت <b>{seconds}</b> ثانیه شروع شد...", parse_mode="HTML")
+
+    report = await profiler.profile(seconds)
+    return await message.answer_document(
+        types.BufferedInputFile(report.encode("utf-8"), filename=f"profile-{seconds}s.txt"),
+        caption=f"🔬 پروفایل {seconds} ثانیه"
+    )
+
+
 # -------------------- پست‌های امروز -------------------- #
 
-@router.message(F.text == "📋 پست‌های امروز")
-async def today(message: types.Message):
-    posts = list_today_posts()
+@button("📋 پست‌های امروز")
+async def today(message: types.Message, state: FSMContext):
+    posts = await list_today_posts()
     if not posts:
         return await message.answer("📭 هیچ پستی وجود ندارد.", reply_markup=admin_keyboard())
 
-    internal = str(SETTINGS.SOURCE_CHANNEL_ID).replace("-100", "")
+    many_sources = len(await list_sources()) > 1
 
     for p in posts:
         msg_id = p["message_id"]
+        source = p["source"]
         ad_num = p.get("ad_number", msg_id)
         active = p.get("active", True)
 
         bell = "🔔" if active else "🔕"
+        internal = str(source).replace("-100", "")
         link = f"https://t.me/c/{internal}/{msg_id}"
 
         text = (
             f"{bell} <b>آگهی شماره #{ad_num}</b>\n"
             f"<a href=\"{link}\">مشاهده پست</a>"
         )
+        if many_sources:
+            text += f"\nمنبع: <code>{source}</code>"
 
         kb = types.InlineKeyboardMarkup(
             inline_keyboard=[
                 [
                     types.InlineKeyboardButton(
                         text="✔ روشن" if active else "❌ خاموش",
-                        callback_data=f"toggle:{msg_id}"
+                        callback_data=f"toggle:{source}:{msg_id}"
                     )
                 ]
             ]
@@ -257,8 +477,11 @@ async def today(message: types.Message):
 
 @router.callback_query(F.data.startswith("toggle:"))
 async def toggle_post_handler(query: types.CallbackQuery):
-    msg_id = int(query.data.split(":")[1])
-    new_state = toggle_post(msg_id)
+    # toggle:<source>:<msg_id>  (دکمه‌های قدیمی: toggle:<msg_id> → منبع پیش‌فرض)
+    parts = query.data.split(":")
+    source = int(parts[1]) if len(parts) == 3 else SETTINGS.SOURCE_CHANNEL_ID
+    msg_id = int(parts[-1])
+    new_state = await toggle_post(msg_id, source)
 
     if new_state is None:
         return await query.answer("❗ پست یافت نشد!", show_alert=True)
@@ -268,7 +491,7 @@ async def toggle_post_handler(query: types.CallbackQuery):
             [
                 types.InlineKeyboardButton(
                     text="✔ روشن" if new_state else "❌ خاموش",
-                    callback_data=f"toggle:{msg_id}"
+                    callback_data=f"toggle:{source}:{msg_id}"
                 )
             ]
         ]
@@ -279,12 +502,9 @@ async def toggle_post_handler(query: types.CallbackQuery):
 
 # -------------------- حالت ارسال -------------------- #
 
-@router.message(F.text == "⚙️ حالت ارسال")
-async def send_mode_menu(message: types.Message):
-    uid = message.from_user.id
-    SENDMODE_STATE[uid] = "main"
-
-    current = get_send_mode()
+@button("⚙️ حالت ارسال")
+async def send_mode_menu(message: types.Message, state: FSMContext):
+    current = await get_send_mode()
 
     return await message.answer(
         f"⚙️ حالت فعلی ارسال: <b>{'🔁 دائمی' if current=='repeat' else '1️⃣ یکبار'}</b>\n\n"
@@ -294,42 +514,37 @@ async def send_mode_menu(message: types.Message):
     )
 
 
-@router.message(F.text.in_(["🔁 ارسال دائمی", "1️⃣ ارسال یکبار"]))
-async def choose_sendmode(message: types.Message):
-    uid = message.from_user.id
-
+@button("🔁 ارسال دائمی", "1️⃣ ارسال یکبار")
+async def choose_sendmode(message: types.Message, state: FSMContext):
     if message.text == "1️⃣ ارسال یکبار":
-        set_send_mode("once")
+        await set_send_mode("once")
         return await message.answer("🔔 حالت «ارسال یکبار» فعال شد.", reply_markup=admin_keyboard())
 
-    set_send_mode("repeat")
-    SENDMODE_STATE[uid] = "choose_unit"
-
+    await set_send_mode("repeat")
     return await message.answer("واحد زمانی را انتخاب کنید:", reply_markup=interval_unit_keyboard())
 
 
-@router.message(F.text.in_(["⏱ ثانیه‌ای", "🕰 دقیقه‌ای", "⏳ ساعتی"]))
-async def choose_unit(message: types.Message):
-    uid = message.from_user.id
-
-    SENDMODE_UNIT[uid] = (
+@button("⏱ ثانیه‌ای", "🕰 دقیقه‌ای", "⏳ ساعتی")
+async def choose_unit(message: types.Message, state: FSMContext):
+    unit = (
         "s" if message.text == "⏱ ثانیه‌ای" else
         "m" if message.text == "🕰 دقیقه‌ای" else
         "h"
     )
+    await set_state(state, "interval", unit=unit)
 
     return await message.answer("⏱ مقدار را وارد کنید:", reply_markup=types.ReplyKeyboardRemove())
 
 
-@router.message(F.text.regexp(r"^\d+$"))
-async def set_interval_handler(message: types.Message):
-    uid = message.from_user.id
-
-    if uid not in SENDMODE_UNIT:
-        return
+@on_state("interval")
+async def set_interval_handler(message: types.Message, state: FSMContext, data: dict):
+    unit = data.get("unit", "s")
+    text = message.text.strip()
+    if not text.isdigit():
+        await set_state(state, "interval", unit=unit)
+        return await message.answer("❗ فقط عدد وارد کنید:")
 
-    unit = SENDMODE_UNIT.pop(uid)
-    value = int(message.text)
+    value = int(text)
 
     sec = (
         value if unit == "s" else
@@ -337,8 +552,8 @@ async def set_interval_handler(message: types.Message):
         value * 3600
     )
 
-    set_interval_value(sec)
-    set_send_mode("repeat")
+    await set_interval_value(sec)
+    await set_send_mode("repeat")
 
     return await message.answer(
         f"⏱ فاصله روی <b>{sec}</b> ثانیه تنظیم شد.",
@@ -349,6 +564,34 @@ async def set_interval_handler(message: types.Message):
 
 # -------------------- بازگشت -------------------- #
 
-@router.message(F.text == "🔙 بازگشت")
-async def back(message: types.Message):
+@button("🔙 بازگشت")
+async def back(message: types.Message, state: FSMContext):
     return await message.answer("بازگشت به پنل مدیریت", reply_markup=admin_keyboard())
+
+
+# -------------------- مسیریابی پیام‌های متنی -------------------- #
+# آخرین هندلر روتر است تا دستورات (/admin ، /dest_interval ...) قبل از آن بررسی شوند.
+
+async def _routable(message: types.Message, state: FSMContext) -> bool:
+    text = message.text
+    if text in BUTTONS:
+        return True
+    return not text.startswith("/") and await state.get_state() in STATES
+
+
+@router.message(F.text, _routable)
+async def route_message(message: types.Message, state: FSMContext):
+    fn = BUTTONS.get(message.text)
+    if fn is not None:
+        # زدن هر دکمه، انتظار قبلی برای ورودی را لغو می‌کند
+        await state.clear()
+        # زمان هر هندلر دکمه جدا (HandlerMetricsMiddleware فقط route_message را می‌بیند)
+        with HANDLER_LATENCY.time(fn.__name__):
+            return await fn(message, state)
+
+    name = await state.get_state()
+    data = await state.get_data()
+    await state.clear()
+    fn = STATES[name]
+    with HANDLER_LATENCY.time(fn.__name__):
+        return await fn(message, state, data)
@@ -1,87 +1,277 @@
 import asyncio
+import time
 from aiogram import Bot
 
+from app.clock import seconds_until_midnight
+from app.cluster import CLUSTER
 from app.config import SETTINGS
-from app.storage.posts import list_today_posts
-from app.storage.dests import list_destinations
-
-# تنظیمات پایدار
-from settings_storage import (
+from app.events import CHANGES
+from app.log import get_logger
+from app.metrics import CYCLE_DURATION, SCHEDULER_LAG, SCHEDULER_STATE
+from app.outbox import OUTBOX, job_id
+from app.storage.dests import dest_sources
+from app.storage.aio import (
+    list_today_posts,
+    rollover,
+    list_active_destinations,
+    update_destination,
     get_send_mode,
-    get_interval
+    get_interval,
 )
 
 
+log = get_logger("scheduler")
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
 # ---------------------- ارسال پست ---------------------- #
 
-async def forward_post(bot: Bot, message_id: int, dest_id: int):
+async def forward_post(bot: Bot, message_id: int, dest_id: int, source_id: int | None = None) -> int:
     """
-    ارسال پست به صورت copy_message.
+    ارسال پست به صورت copy_message؛ خروجی message_id کپی در مقصد است.
+    source_id → کانال منبع (پیش‌فرض: SOURCE_CHANNEL_ID)
+    خطا به صف ارسال (outbox) برگردانده می‌شود تا تصمیم بگیرد دوباره تلاش کند یا نه.
     """
+    started = time.perf_counter()
     try:
-        await bot.copy_message(
+        copied = await bot.copy_message(
             chat_id=dest_id,
-            from_chat_id=SETTINGS.SOURCE_CHANNEL_ID,
+            from_chat_id=source_id or SETTINGS.SOURCE_CHANNEL_ID,
             message_id=message_id
         )
-        print(f"[SCHEDULER] Copied → msg:{message_id} → dest:{dest_id}")
+        log.success("copied", msg_id=message_id, dest=dest_id, latency_ms=_ms(started))
+        return copied.message_id
 
     except Exception as e:
-        print("COPY ERROR TYPE:", type(e))
-        print(f"[SCHEDULER] ERROR → {e}")
+        log.warning(
+            "copy failed", msg_id=message_id, dest=dest_id, latency_ms=_ms(started),
+            error=type(e).__name__, detail=str(e)
+        )
+        raise
+
+
+async def forward_posts(bot: Bot, message_ids: list[int], dest_id: int,
+                        source_id: int | None = None) -> list[int]:
+    """
+    ارسال چند پست با یک copyMessages (حداکثر 100، به ترتیب صعودی).
+    آلبوم‌ها در این حالت گروهی باقی می‌مانند.
+    خروجی: message_id کپی‌ها به همان ترتیب
+    """
+    started = time.perf_counter()
+    try:
+        copied = await bot.copy_messages(
+            chat_id=dest_id,
+            from_chat_id=source_id or SETTINGS.SOURCE_CHANNEL_ID,
+            message_ids=message_ids
+        )
+        log.success(
+            "copied batch", msg_id=message_ids[0], msgs=len(message_ids), dest=dest_id,
+            latency_ms=_ms(started)
+        )
+        return [m.message_id for m in copied]
+
+    except Exception as e:
+        log.warning(
+            "batch copy failed", msg_id=message_ids[0], msgs=len(message_ids), dest=dest_id,
+            latency_ms=_ms(started), error=type(e).__name__, detail=str(e)
+        )
+        raise
+
+
+# ---------------------- زمان‌بندی هر مقصد ---------------------- #
+
+def plan_cycle(posts: list[dict], index: int, total: int,
+               cycle_at: float, window: float) -> list[tuple[float, dict]]:
+    """
+    زمان سررسید هر پست برای یک مقصد در یک چرخه.
+    - حالت عادی  → همه در ابتدای چرخه
+    - حالت یکنواخت → پخش مساوی در طول window؛ مقصدها با فاز index/total
+      بین هم قرار می‌گیرند تا کل ارسال‌ها یک جریان یکنواخت بسازند.
+    """
+    if not SETTINGS.SMOOTH_SEND:
+        return [(cycle_at, p) for p in posts]
+
+    step = window / len(posts)
+    phase = index / total
+
+    return [
+        (cycle_at + (k + phase) * step, p)
+        for k, p in enumerate(posts)
+    ]
+
+
+def _stretch(dest_posts: dict[int, list[dict]], dests: list[dict], interval: int) -> float:
+    """
+    اگر TARGET_RATE تنظیم شده و نرخ لازم از آن بیشتر است،
+    ضریب کش‌آمدن چرخه‌ها را برمی‌گرداند (interval هر مقصد در آن ضرب می‌شود).
+    """
+    if not SETTINGS.SMOOTH_SEND or SETTINGS.TARGET_RATE <= 0:
+        return 1.0
+
+    rate = sum(len(dest_posts[d["chat_id"]]) / (d.get("interval") or interval) for d in dests)
+    return max(1.0, rate / SETTINGS.TARGET_RATE)
 
 
 # ---------------------- Scheduler اصلی ---------------------- #
 
+# در حالت ارسال یکبار، فاصله‌ی گزارش زنده‌بودن scheduler
+IDLE_HEARTBEAT = 300
+
+
+def _alive(next_in: float):
+    now = time.time()
+    SCHEDULER_STATE["last_cycle"] = now
+    SCHEDULER_STATE["next_wake"] = now + next_in
+
+
 async def start_scheduler(bot: Bot):
     """
     - حالت ارسال یکبار → هیچ ارسال دوره‌ای نکن
     - حالت ارسال دائمی → ارسال دوره‌ای طبق interval
+      (هر مقصد می‌تواند interval مخصوص خودش را داشته باشد)
+
+    ارسال‌ها در outbox ثبت می‌شوند. اگر ربات وسط یک چرخه ری‌استارت شود،
+    همان چرخه (با همان شناسه) دوباره ثبت می‌شود و فقط ارسال‌های انجام‌نشده می‌مانند.
+
+    به‌جای sleep ثابت، منتظر کانال تغییرات می‌ماند: تغییر تنظیمات، پست یا مقصد
+    scheduler را فوراً بیدار می‌کند.
     """
 
-    print("[SCHEDULER] Scheduler started and running...")
+    log.info("scheduler started")
+
+    changes = CHANGES.subscribe()
+
+    # مقصدهایی که چرخه‌ی جاری‌شان در همین اجرا ثبت شده: chat_id -> cycle
+    planned: dict[int, int] = {}
+    topics: set[str] = set()
 
     while True:
         try:
-            send_mode = get_send_mode()
-            interval = get_interval()
+            # تأخیر بیدارشدن نسبت به برنامه (فشار روی event loop)
+            if not topics and SCHEDULER_STATE["next_wake"]:
+                SCHEDULER_LAG.set(max(0.0, time.time() - SCHEDULER_STATE["next_wake"]))
 
-            # حالت ارسال یکبار
+            # پست یا مقصد جدید → برنامه‌ی چرخه‌های جاری دوباره ساخته شود
+            # (ارسال‌های قبلاً ثبت‌شده تکرار نمی‌شوند)
+            if topics & {"posts", "dests"}:
+                planned.clear()
+            topics = set()
+
+            send_mode = await get_send_mode()
+            interval = await get_interval()
+
+            # حالت ارسال یکبار → تا تغییر بعدی کاری نیست
+            # (هر 5 دقیقه فقط برای گزارش زنده‌بودن در /healthz)
             if send_mode == "once":
-                await asyncio.sleep(5)
+                _alive(IDLE_HEARTBEAT)
+                topics = await changes.wait(IDLE_HEARTBEAT)
                 continue
 
             # حالت ارسال دائمی
-            posts = list_today_posts()
-            dests = list_destinations()
+            today_posts = await list_today_posts()
+            posts = [p for p in today_posts if p.get("active", True)]
+
+            # پست خاموش‌شده → ارسال‌های در صف آن لغو می‌شوند
+            # (با روشن‌شدن دوباره، همان چرخه دوباره برنامه‌ریزی می‌شود)
+            inactive = {(p["source"], p["message_id"]) for p in today_posts if not p.get("active", True)}
+            if inactive:
+                OUTBOX.cancel_posts(inactive)
+            # حالت خوشه → فقط مقصدهای shardهای همین worker
+            dests = [d for d in await list_active_destinations() if CLUSTER.owns(d["chat_id"])]
 
             if not posts:
-                print("[SCHEDULER] No posts for today.")
-                await asyncio.sleep(interval)
+                log.info("no posts for today")
+                _alive(interval)
+                topics = await changes.wait(interval)
                 continue
 
             if not dests:
-                print("[SCHEDULER] No destinations set.")
-                await asyncio.sleep(interval)
+                log.info("no destinations")
+                _alive(interval)
+                topics = await changes.wait(interval)
                 continue
 
-            print(
-                f"[SCHEDULER] Sending {len(posts)} posts → {len(dests)} destinations "
-                f"(interval={interval}s)"
-            )
+            started = time.perf_counter()
 
+            # پست‌های هر مقصد فقط از منبع‌های خودش (جدول مسیریابی)
+            by_source: dict[int, list[dict]] = {}
             for p in posts:
-                if not p.get("active", True):
+                by_source.setdefault(p["source"], []).append(p)
+            dest_posts = {
+                d["chat_id"]: [p for s in dest_sources(d) for p in by_source.get(s, ())]
+                for d in dests
+            }
+
+            stretch = _stretch(dest_posts, dests, interval)
+            if stretch > 1:
+                log.warning("target rate too low, stretching cycles", stretch=round(stretch, 2))
+
+            now = time.time()
+            next_wake = now + interval
+            queued = 0
+
+            for i, d in enumerate(dests):
+                chat_id = d["chat_id"]
+                # خود چرخه کش می‌آید (نه فقط پنجره‌ی ارسال) تا چرخه‌ها روی هم نیفتند
+                d_interval = (d.get("interval") or interval) * stretch
+
+                d_posts = dest_posts[chat_id]
+                if not d_posts:
                     continue
 
-                msg_id = p["message_id"]
+                # چرخه‌ی جاری این مقصد: ادامه‌ی چرخه‌ی قبلی یا شروع چرخه‌ی جدید
+                cycle_at = d.get("last_cycle_at", 0)
+                if now >= cycle_at + d_interval:
+                    cycle_at = now
+                    await update_destination(chat_id, notify=False, last_cycle_at=cycle_at)
+                    OUTBOX.new_cycle(chat_id, int(cycle_at))
 
-                for d in dests:
-                    await forward_post(bot, msg_id, d["chat_id"])
+                cycle = int(cycle_at)
+                next_wake = min(next_wake, cycle_at + d_interval)
 
-            print("[SCHEDULER] Cycle done.")
-            await asyncio.sleep(interval)
+                if planned.get(chat_id) == cycle:
+                    continue
+                planned[chat_id] = cycle
+
+                for due_at, p in plan_cycle(d_posts, i, len(dests), cycle_at, d_interval):
+                    msg_id = p["message_id"]
+                    queued += OUTBOX.enqueue(
+                        job_id(str(cycle), p["source"], msg_id, chat_id), msg_id, chat_id, due_at,
+                        p.get("message_ids"), source=p["source"]
+                    )
+
+            if queued:
+                OUTBOX.prune()
+                log.info(
+                    "cycle queued", posts=len(posts), dests=len(dests), jobs=queued,
+                    interval=interval, outbox=OUTBOX.depth()
+                )
+
+            CYCLE_DURATION.observe(time.perf_counter() - started)
+
+            delay = max(1.0, next_wake - time.time())
+            _alive(delay)
+            topics = await changes.wait(delay)
 
         except Exception as e:
-            print(f"[SCHEDULER] LOOP ERROR → {e}")
+            log.exception("loop failed", error=type(e).__name__)
             await asyncio.sleep(5)
+
+
+# ---------------------- جابه‌جایی نیمه‌شب ---------------------- #
+
+async def start_rollover():
+    """
+    یک‌بار در استارت و سپس هر نیمه‌شب (به وقت TIMEZONE):
+    روزهای قدیمی پست‌ها از حافظه خارج و بایگانی می‌شوند.
+    """
+    while True:
+        try:
+            await rollover()
+        except Exception as e:
+            log.exception("rollover failed", error=type(e).__name__)
+
+        await asyncio.sleep(seconds_until_midnight())
@@ -1,15 +1,25 @@
+import asyncio
 from aiogram import Router, types
-from datetime import date
+from aiogram.exceptions import TelegramBadRequest
 import re
 
+from app.clock import today_iso
 from app.config import SETTINGS
-from app.storage.posts import add_post, mark_sent_once, is_sent_once
-from app.storage.dests import list_destinations
-
-# حالت ارسال از فایل تنظیمات
-from settings_storage import get_send_mode
+from app.botpool import POOL
+from app.log import get_logger
+from app.outbox import OUTBOX, job_id
+from app.storage.aio import (
+    add_post,
+    mark_sent_once,
+    is_sent_once,
+    route_destinations,
+    is_source,
+    get_copies,
+    get_send_mode,
+)
 
 router = Router()
+log = get_logger("source")
 
 
 # ---------------------- استخراج شماره آگهی ---------------------- #
@@ -31,30 +41,61 @@ def extract_ad_number(text: str) -> int | None:
 
 # ---------------------- ارسال فوری در حالت ارسال یکبار ---------------------- #
 
-async def send_once_immediately(bot, message_id: int):
+async def send_once_immediately(bot, message_id: int, message_ids: list[int] | None = None,
+                                source: int | None = None):
     """
     اگر حالت ارسال one-time فعال باشد،
-    پیام *فوری* بدون تأخیر ارسال می‌شود.
+    پیام *فوری* بدون تأخیر برای مقصدهای همین منبع در صف ارسال (outbox) قرار می‌گیرد.
+    صف پایدار است، پس بعد از ری‌استارت هم ارسال ادامه پیدا می‌کند.
     """
+    source = source or SETTINGS.SOURCE_CHANNEL_ID
 
-    dests = list_destinations()
+    dests = await route_destinations(source)
     if not dests:
-        print("[SOURCE] No destinations → skip sending.")
+        log.info("no destinations for source", source=source)
         return
 
+    queued = 0
     for d in dests:
-        try:
-            await bot.copy_message(
-                chat_id=d["chat_id"],
-                from_chat_id=SETTINGS.SOURCE_CHANNEL_ID,
-                message_id=message_id
-            )
-            print(f"[SOURCE] One-time SEND → msg:{message_id} → dest:{d['chat_id']}")
-        except Exception as e:
-            print(f"[SOURCE] ERROR sending to {d['chat_id']}: {e}")
+        queued += OUTBOX.enqueue(
+            job_id("once", source, message_id, d["chat_id"]), message_id, d["chat_id"],
+            message_ids=message_ids, source=source
+        )
+
+    log.info("one-time send queued", msg_id=message_id, source=source, dests=queued)
 
     # علامت‌گذاری برای اینکه دوباره ارسال نشود
-    mark_sent_once(message_id)
+    await mark_sent_once(message_id, source)
+
+
+# ---------------------- جمع‌کردن آلبوم‌ها ---------------------- #
+
+# پیام‌های یک آلبوم جدا جدا می‌رسند؛ تا ALBUM_WINDOW ثانیه بدون پیام جدید صبر می‌کنیم
+ALBUM_WINDOW = 1.0
+
+_ALBUMS: dict[tuple[int, str], list[types.Message]] = {}
+
+
+async def _collect_album(message: types.Message) -> list[types.Message] | None:
+    """
+    اولین پیام آلبوم منتظر بقیه می‌ماند و کل گروه را برمی‌گرداند.
+    پیام‌های بعدی فقط اضافه می‌شوند و None برمی‌گردانند.
+    """
+    gid = (message.chat.id, message.media_group_id)
+
+    if gid in _ALBUMS:
+        _ALBUMS[gid].append(message)
+        return None
+
+    _ALBUMS[gid] = [message]
+
+    while True:
+        count = len(_ALBUMS[gid])
+        await asyncio.sleep(ALBUM_WINDOW)
+        if len(_ALBUMS[gid]) == count:
+            break
+
+    return sorted(_ALBUMS.pop(gid), key=lambda m: m.message_id)
 
 
 # ---------------------- دریافت پیام جدید کانال ---------------------- #
@@ -63,39 +104,155 @@ async def send_once_immediately(bot, message_id: int):
 async def on_channel_post(message: types.Message):
     """
     وقتی پست جدید دریافت شد:
-    1) استخراج شماره آگهی
-    2) ذخیره پست در فایل
-    3) اگر send_mode == once → ارسال فوری
+    1) جمع‌کردن آلبوم (media_group_id) به‌عنوان یک پست
+    2) استخراج شماره آگهی
+    3) ذخیره پست در فایل
+    4) اگر send_mode == once → ارسال فوری
     """
 
-    # فقط برای کانال منبع
-    if message.chat.id != SETTINGS.SOURCE_CHANNEL_ID:
+    # فقط برای کانال‌های منبع (جستجو در جدول مسیریابی)
+    source = message.chat.id
+    if not await is_source(source):
         return
 
-    msg_id = message.message_id
-    today = date.today().isoformat()
+    messages = [message]
+
+    if message.media_group_id:
+        messages = await _collect_album(message)
+        if messages is None:
+            return
+
+    msg_id = messages[0].message_id
+    msg_ids = [m.message_id for m in messages]
+    today = today_iso()
 
-    # استخراج شماره آگهی
-    ad_num = extract_ad_number(message.text or message.caption or "")
+    # استخراج شماره آگهی (در آلبوم معمولاً فقط یک عکس کپشن دارد)
+    ad_num = None
+    for m in messages:
+        ad_num = extract_ad_number(m.text or m.caption or "")
+        if ad_num is not None:
+            break
 
     # ذخیره پست
-    add_post(
+    await add_post(
         message_id=msg_id,
         msg_date=today,
         ad_number=ad_num,
+        message_ids=msg_ids,
+        source=source,
     )
 
-    print(f"[SOURCE] New post saved → msg:{msg_id} | ad:{ad_num}")
+    log.info("post saved", source=source, msg_id=msg_id, items=len(msg_ids), ad=ad_num)
 
     # ---------------------- حالت ارسال یکبار ---------------------- #
 
-    mode = get_send_mode()
+    mode = await get_send_mode()
 
     if mode == "once":
         # جلوگیری از ارسال دوباره
-        if is_sent_once(msg_id):
-            print(f"[SOURCE] Already sent_once → skip msg:{msg_id}")
+        if await is_sent_once(msg_id, source):
+            log.info("already sent once", msg_id=msg_id, source=source)
             return
 
-        print("[SOURCE] SEND_MODE = once → sending immediately...")
-        await send_once_immediately(message.bot, msg_id)
+        await send_once_immediately(message.bot, msg_id, msg_ids, source)
+
+
+# ---------------------- ویرایش پست کانال ---------------------- #
+
+def _input_media(message: types.Message):
+    """
+    ساخت InputMedia از پیام ویرایش‌شده (با همان file_id و کپشن جدید).
+    برای پیام‌هایی که editMessageMedia ندارند None برمی‌گرداند.
+    """
+    caption = {"caption": message.caption, "caption_entities": message.caption_entities}
+
+    if message.photo:
+        return types.InputMediaPhoto(media=message.photo[-1].file_id, **caption)
+    if message.video:
+        return types.InputMediaVideo(media=message.video.file_id, **caption)
+    if message.animation:
+        return types.InputMediaAnimation(media=message.animation.file_id, **caption)
+    if message.audio:
+        return types.InputMediaAudio(media=message.audio.file_id, **caption)
+    if message.document:
+        return types.InputMediaDocument(media=message.document.file_id, **caption)
+    return None
+
+
+def _edit_call(bot, message: types.Message, chat_id: int, copy_id: int):
+    """
+    file_id هر ربات مخصوص خودش است: فقط رباتی که ویرایش را دریافت کرده (ربات اصلی)
+    می‌تواند با file_idهای پیام منبع editMessageMedia بفرستد.
+    کپی‌های ربات‌های ارسال دیگر فقط کپشن را ویرایش می‌کنند.
+    """
+    if message.text is not None:
+        return lambda: bot.edit_message_text(
+            text=message.text,
+            chat_id=chat_id,
+            message_id=copy_id,
+            entities=message.entities,
+        )
+
+    media = _input_media(message) if bot.id == message.bot.id else None
+    if media is not None:
+        return lambda: bot.edit_message_media(media=media, chat_id=chat_id, message_id=copy_id)
+
+    return lambda: bot.edit_message_caption(
+        chat_id=chat_id,
+        message_id=copy_id,
+        caption=message.caption,
+        caption_entities=message.caption_entities,
+    )
+
+
+async def propagate_edit(message: types.Message) -> int:
+    """
+    اعمال ویرایش پیام منبع روی همه‌ی کپی‌های موجود آن
+    (editMessageText / editMessageMedia / editMessageCaption)
+    به‌جای ارسال دوباره؛ در هر مقصد همه‌ی کپی‌های چرخه‌های قبلی هم ویرایش می‌شوند.
+    خروجی: تعداد کپی‌ها.
+    """
+    copies = await get_copies(message.chat.id, message.message_id)
+    if not copies:
+        return 0
+
+    def job(bot, chat_id: int, copy_id: int):
+        call = _edit_call(bot, message, chat_id, copy_id)
+
+        async def run():
+            try:
+                await call()
+            except TelegramBadRequest as e:
+                # محتوای کپی از قبل همین است
+                if "not modified" not in str(e):
+                    raise
+
+        return chat_id, run
+
+    # هر کپی فقط با همان رباتی ویرایش می‌شود که آن را فرستاده
+    by_engine = {}
+    is_media = message.text is None and _input_media(message) is not None
+    caption_only = 0
+    for chat_id, copy_ids in copies.items():
+        bot, engine = POOL.route(chat_id)
+        by_engine.setdefault(engine, []).extend(job(bot, chat_id, copy_id) for copy_id in copy_ids)
+        if is_media and bot.id != message.bot.id:
+            caption_only += len(copy_ids)
+
+    if caption_only:
+        log.info(
+            "media not replaced on sender-bot copies (caption only)",
+            msg_id=message.message_id, source=message.chat.id, copies=caption_only
+        )
+
+    await asyncio.gather(*(engine.run(jobs) for engine, jobs in by_engine.items()))
+    return sum(len(jobs) for jobs in by_engine.values())
+
+
+@router.edited_channel_post()
+async def on_edited_channel_post(message: types.Message):
+    if not await is_source(message.chat.id):
+        return
+
+    edited = await propagate_edit(message)
+    log.info("edit propagated", msg_id=message.message_id, source=message.chat.id, copies=edited)
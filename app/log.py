@@ -0,0 +1,138 @@
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from app.config import SETTINGS
+from app.metrics import LOG_DROPPED
+
+
+# ---------------------- لاگ ساختاریافته ---------------------- #
+# هر زیرسیستم یک Logger دارد (get_logger("outbox") → "fwd.outbox").
+# رکوردها در صف کران‌دار قرار می‌گیرند و یک thread جدا آن‌ها را به JSON
+# تبدیل و روی stdout می‌نویسد؛ event loop هیچ‌وقت منتظر stdout نمی‌ماند.
+#   {"ts": ..., "level": "INFO", "sys": "outbox", "msg": "retry", "msg_id": 12, "dest": -100...}
+
+ROOT = "fwd"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "sys": record.name.removeprefix(ROOT + "."),
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler بدون انتظار: صف پر → رکورد دور ریخته و شمرده می‌شود.
+    فقط پیام ساخته می‌شود؛ تبدیل به JSON در thread نویسنده است.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class Log:
+    """
+    Logger یک زیرسیستم با فیلدهای ساختاریافته:
+        log.info("copied", msg_id=12, dest=-100..., latency_ms=41.2)
+    success → لاگ پرتعداد موفقیت؛ فقط سهم LOG_SAMPLE از آن نوشته می‌شود.
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(f"{ROOT}.{name}")
+
+    def _log(self, level: int, msg: str, fields: dict, exc_info=None):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, msg: str, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+    def success(self, msg: str, **fields):
+        if SETTINGS.LOG_SAMPLE < 1 and random.random() >= SETTINGS.LOG_SAMPLE:
+            return
+        if SETTINGS.LOG_SAMPLE < 1:
+            fields["sampled"] = SETTINGS.LOG_SAMPLE
+        self._log(logging.INFO, msg, fields)
+
+
+def get_logger(name: str) -> Log:
+    return Log(name)
+
+
+# ---------------------- راه‌اندازی ---------------------- #
+
+_LISTENER: QueueListener | None = None
+
+
+def setup_logging():
+    """
+    صف + thread نویسنده، سطح کلی LOG_LEVEL و سطح هر زیرسیستم از LOG_LEVELS.
+    لاگ‌های aiogram و aiohttp هم از همین مسیر می‌گذرند.
+    """
+    global _LISTENER
+
+    if _LISTENER is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    q: queue.Queue = queue.Queue(maxsize=SETTINGS.LOG_QUEUE_SIZE)
+    _LISTENER = QueueListener(q, stream, respect_handler_level=False)
+    _LISTENER.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [DroppingQueueHandler(q)]
+    root.setLevel(SETTINGS.LOG_LEVEL)
+
+    # نام زیرسیستم (outbox) یا نام کامل logger کتابخانه (aiogram.event)
+    for name, level in SETTINGS.LOG_LEVELS.items():
+        if name.split(".")[0] not in ("aiogram", "aiohttp"):
+            name = f"{ROOT}.{name}"
+        logging.getLogger(name).setLevel(level)
+
+
+def stop_logging():
+    """نوشتن رکوردهای باقی‌مانده در صف (برای خاموش‌شدن ربات)."""
+    global _LISTENER
+
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
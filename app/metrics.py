@@ -0,0 +1,180 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+
+# ---------------------- متریک‌های ساده (فرمت Prometheus) ---------------------- #
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        REGISTRY.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, doc, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    مقدار لحظه‌ای؛ با func مقدار هنگام خواندن /metrics محاسبه می‌شود.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, func: Callable[[], float] | None = None):
+        super().__init__(name, doc)
+        self.func = func
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> list[str]:
+        value = self.func() if self.func else self.value
+        return self._header() + [f"{self.name} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [شمارش هر bucket..., sum, count]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for labels, row in self._values.items():
+            names = self.label_names + ("le",)
+            acc = 0
+            for bound, n in zip(self.buckets, row):
+                acc += n
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {acc}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {row[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {row[-1]}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    """خروجی متنی همه‌ی متریک‌ها برای /metrics."""
+    lines = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------- متریک‌های ربات ---------------------- #
+
+API_LATENCY = Histogram(
+    "forwardbot_api_request_seconds", "Bot API request latency", ("method",)
+)
+API_ERRORS = Counter(
+    "forwardbot_errors_total", "Errors by exception type", ("where", "type")
+)
+DELIVERIES = Counter(
+    "forwardbot_deliveries_total", "Finished outbox jobs by result", ("result",)
+)
+DELIVERY_LAG = Histogram(
+    "forwardbot_delivery_lag_seconds", "Delay between a job's due time and its delivery"
+)
+QUEUE_DEPTH = Gauge(
+    "forwardbot_outbox_depth", "Pending jobs in the outbox"
+)
+CYCLE_DURATION = Histogram(
+    "forwardbot_scheduler_cycle_seconds", "Time spent planning one scheduler cycle"
+)
+SCHEDULER_LAG = Gauge(
+    "forwardbot_scheduler_lag_seconds", "How late the scheduler woke up compared to its plan"
+)
+STORAGE_LATENCY = Histogram(
+    "forwardbot_storage_seconds", "Storage load/save latency", ("op",)
+)
+UPDATE_LATENCY = Histogram(
+    "forwardbot_update_seconds", "Update processing latency", ("type",)
+)
+HANDLER_LATENCY = Histogram(
+    "forwardbot_handler_seconds", "Handler latency by handler name", ("handler",)
+)
+LOG_DROPPED = Counter(
+    "forwardbot_log_dropped_total", "Log records dropped because the log queue was full"
+)
+
+
+# ---------------------- وضعیت scheduler (برای /healthz) ---------------------- #
+
+SCHEDULER_STATE = {
+    "last_cycle": 0.0,   # پایان آخرین دور حلقه (epoch)
+    "next_wake": 0.0,    # زمان برنامه‌ریزی‌شده‌ی دور بعد (epoch)
+}
+
+
+def scheduler_health(grace: float = 60) -> tuple[bool, dict]:
+    """
+    scheduler سالم است اگر از زمان بیدارشدن برنامه‌ریزی‌شده‌اش
+    بیشتر از grace ثانیه نگذشته باشد.
+    """
+    now = time.time()
+    last = SCHEDULER_STATE["last_cycle"]
+    next_wake = SCHEDULER_STATE["next_wake"]
+
+    ok = last > 0 and now <= next_wake + grace
+    return ok, {
+        "ok": ok,
+        "seconds_since_last_cycle": round(now - last, 3) if last else None,
+        "next_wake_in": round(next_wake - now, 3) if next_wake else None,
+    }
@@ -0,0 +1,124 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import TelegramMethod, TelegramType, Response
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from app.log import get_logger
+from app.metrics import API_LATENCY, API_ERRORS, UPDATE_LATENCY, HANDLER_LATENCY
+
+log = get_logger("handlers")
+
+
+# ---------------------- متریک فراخوانی‌های Bot API ---------------------- #
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    زمان هر درخواست به Bot API (بر اساس نام متد) و خطاهای آن.
+    روی session ربات ثبت می‌شود: bot.session.middleware(...)
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        start = time.perf_counter()
+
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc("api", type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start, name)
+
+
+# ---------------------- متریک پردازش آپدیت‌ها ---------------------- #
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    زمان پردازش هر آپدیت (بر اساس نوع: message / channel_post / callback_query ...).
+    روی dp.update.outer_middleware ثبت می‌شود.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        kind = event.event_type if isinstance(event, Update) else type(event).__name__
+        start = time.perf_counter()
+
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            API_ERRORS.inc("handler", type(e).__name__)
+            raise
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - start, kind)
+
+
+# ---------------------- متریک هر هندلر ---------------------- #
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    زمان هر هندلر (بر اساس نام تابع: on_channel_post ، toggle_post_handler ...).
+    به‌صورت inner middleware روی observerهای dp ثبت می‌شود و روی همه‌ی روترها اعمال می‌شود.
+    هندلر کندتر از slow ثانیه → لاگ هشدار.
+    """
+
+    def __init__(self, slow: float = 5.0):
+        self.slow = slow
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        callback = getattr(data.get("handler"), "callback", None)
+        name = getattr(callback, "__name__", "unknown")
+        start = time.perf_counter()
+
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - start
+            HANDLER_LATENCY.observe(elapsed, name)
+            if elapsed >= self.slow:
+                log.warning("slow handler", handler=name, latency_ms=round(elapsed * 1000, 1))
+
+
+# ---------------------- دسترسی ادمین ---------------------- #
+
+class AdminOnlyMiddleware(BaseMiddleware):
+    """
+    قبل از اجرای هر هندلر پنل مدیریت، ادمین بودن کاربر را بررسی می‌کند.
+    به‌صورت inner middleware روی router.message / router.callback_query ثبت می‌شود
+    تا فقط پیام‌هایی که واقعاً به یک هندلر ادمین می‌خورند بررسی شوند.
+    """
+
+    def __init__(self, is_admin: Callable[[int], bool]):
+        self.is_admin = is_admin
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is not None and self.is_admin(user.id):
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery):
+            return await event.answer("⛔ شما ادمین نیستید.", show_alert=True)
+        if isinstance(event, Message) and (event.text or "").startswith("/admin"):
+            return await event.answer("⛔ شما ادمین نیستید.")
+        return None
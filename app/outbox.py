@@ -0,0 +1,559 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+from app.cluster import CLUSTER
+from app.config import SETTINGS
+from app.delivery import ENGINE, DeliveryEngine
+from app.events import CHANGES
+from app.log import get_logger
+from app.metrics import DELIVERIES, DELIVERY_LAG, API_ERRORS, QUEUE_DEPTH
+from app.storage.aio import run as storage_run, submit as storage_submit
+from app.storage.backend import get_backend
+from app.storage.copies import record_copies
+from app.storage.dests import get_destination, is_quarantined, retry_at, record_success, record_failure
+
+log = get_logger("outbox")
+
+# خطاهایی که تلاش دوباره فایده ندارد
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+# تابع ارسال: (bot, message_id, chat_id, source) → message_id کپی
+Deliver = Callable[[Bot, int, int, int], Awaitable]
+
+# تابع ارسال گروهی: (bot, [message_id, ...], chat_id, source) → copyMessages → لیست message_id کپی‌ها
+DeliverMany = Callable[[Bot, list[int], int, int], Awaitable]
+
+# سقف copyMessages در Bot API
+COPY_BATCH = 100
+
+# متن خطاهایی که یعنی خود مقصد از دسترس خارج شده (نه فقط همین پیام)
+DEST_ERRORS = (
+    "chat not found",
+    "bot was kicked",
+    "bot is not a member",
+    "not enough rights",
+    "have no rights",
+    "chat_write_forbidden",
+    "group chat was deactivated",
+)
+
+
+def _ids(job: dict) -> list[int]:
+    return job.get("message_ids") or [job["message_id"]]
+
+
+def job_id(prefix: str, source: int, message_id: int, chat_id: int) -> str:
+    """شناسه‌ی job: prefix:source:msg:chat"""
+    return f"{prefix}:{source}:{message_id}:{chat_id}"
+
+
+def _chat_of(job_id: str) -> int:
+    # آخرین بخش شناسه‌ی job همیشه chat_id است
+    return int(job_id.rpartition(":")[2])
+
+
+def _hand_off(job: dict):
+    """ذخیره‌ی job یک shard دیگر و بعد اعلان به مالکش (روی thread ذخیره‌سازی، به همین ترتیب)."""
+    get_backend().save_job(job)
+    CHANGES.publish("outbox")
+
+
+def _owned_jobs() -> list[dict]:
+    return [j for j in get_backend().load_jobs() if CLUSTER.owns(j["chat_id"])]
+
+
+def _dest_gone(error: Exception) -> bool:
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    text = str(error).lower()
+    return any(m in text for m in DEST_ERRORS)
+
+
+# ---------------------- صف پایدار ارسال ---------------------- #
+
+class Outbox:
+    """
+    صف پایدار ارسال (outbox).
+    هر job یعنی «پست message_id از کانال source به مقصد chat_id» با شماره‌ی تلاش و زمان سررسید.
+    - jobها قبل از ارسال ذخیره می‌شوند → بعد از ری‌استارت ادامه پیدا می‌کنند
+    - خطای موقت → تلاش دوباره با backoff نمایی
+    - jobهای تمام‌شده علامت می‌خورند → همان id دوباره در صف نمی‌رود
+    - jobهای سررسیده‌ی یک مقصد با هم در یک copyMessages ارسال می‌شوند
+    - در حالت خوشه فقط jobهای مقصدهای همین worker در حافظه می‌مانند؛
+      بقیه فقط ذخیره می‌شوند تا worker مالکشان با sync بردارد
+    """
+
+    def __init__(
+        self,
+        engine: DeliveryEngine = ENGINE,
+        workers: int = SETTINGS.SEND_CONCURRENCY,
+        max_attempts: int = SETTINGS.OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = 2.0,
+        backoff_max: float = 600.0,
+        done_ttl: float = 86400,
+    ):
+        self.engine = engine
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.done_ttl = done_ttl
+
+        self._jobs: dict[str, dict] = {}
+        self._pairs: dict[tuple[int, int, int], str] = {}
+        self._by_chat: dict[int, dict[str, dict]] = {}
+        self._inflight: set[str] = set()
+        self._done: dict[str, float] = {}
+        self._done_by_chat: dict[int, set[str]] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._loaded = False
+
+        self._bot: Bot | None = None
+        self._pool = None
+        self._deliver: Deliver | None = None
+        self._deliver_many: DeliverMany | None = None
+
+    # ---- بارگذاری ---- #
+    def load(self):
+        backend = get_backend()
+        backend.prune_done(time.time() - self.done_ttl)
+
+        self._set_done(backend.load_done())
+        for job in backend.load_jobs():
+            if CLUSTER.owns(job["chat_id"]):
+                self._add(job)
+
+        self._loaded = True
+        log.info("loaded pending jobs", jobs=len(self._jobs))
+
+    def _add(self, job: dict):
+        self._jobs[job["id"]] = job
+        self._pairs[(job["source"], job["message_id"], job["chat_id"])] = job["id"]
+        self._by_chat.setdefault(job["chat_id"], {})[job["id"]] = job
+        heapq.heappush(self._heap, (job["due_at"], job["id"]))
+
+    def depth(self) -> int:
+        return len(self._jobs)
+
+    # ---- افزودن ---- #
+    def enqueue(self, job_id: str, message_id: int, chat_id: int, due_at: float | None = None,
+                message_ids: list[int] | None = None, source: int | None = None) -> bool:
+        """
+        خروجی False یعنی این job قبلاً انجام شده
+        یا همین پست برای همین مقصد هنوز در صف است.
+        message_ids → همه‌ی پیام‌های یک آلبوم (یک واحد ارسال)
+        source → کانال منبع (پیش‌فرض: SOURCE_CHANNEL_ID)
+        """
+        source = source or SETTINGS.SOURCE_CHANNEL_ID
+
+        if job_id in self._jobs or job_id in self._done:
+            return False
+
+        if (source, message_id, chat_id) in self._pairs:
+            return False
+
+        job = {
+            "id": job_id,
+            "source": source,
+            "message_id": message_id,
+            "chat_id": chat_id,
+            "attempt": 0,
+            "due_at": due_at or time.time(),
+        }
+        if message_ids and len(message_ids) > 1:
+            job["message_ids"] = list(message_ids)
+
+        # مقصد مال worker دیگری است → همان ذخیره (و خبر دادن به مالکش) کافی است
+        if not CLUSTER.owns(chat_id):
+            storage_submit(_hand_off, dict(job))
+            return True
+
+        storage_submit(get_backend().save_job, dict(job))
+
+        self._add(job)
+        self._wake.set()
+        return True
+
+    async def sync(self, rebalanced: bool = False, topics: set[str] = frozenset()):
+        """
+        حالت خوشه (بعد از هر heartbeat):
+        - jobهای مقصدهایی که دیگر مال این worker نیستند از حافظه خارج می‌شوند
+          (در backend می‌مانند تا مالک جدید بردارد)
+        - فقط وقتی shardها عوض شده‌اند یا worker دیگری برای ما job گذاشته (topic "outbox")
+          jobهای مقصدهای این worker در thread ذخیره‌سازی از backend خوانده می‌شوند
+        rebalanced → نشانه‌های اتمام هم دوباره خوانده می‌شوند
+        تا چرخه‌ای که مالک قبلی فرستاده تکرار نشود.
+        """
+        backend = get_backend()
+        if rebalanced:
+            done = await storage_run(backend.load_done)
+            # نشانه‌هایی که در همین فاصله اضافه شده‌اند
+            done.update(self._done)
+            self._set_done(done)
+
+        for job in list(self._jobs.values()):
+            if job["id"] not in self._inflight and not CLUSTER.owns(job["chat_id"]):
+                self._forget(job)
+
+        if not rebalanced and "outbox" not in topics:
+            return
+
+        added = 0
+        for job in await storage_run(_owned_jobs):
+            # job در همین فاصله تمام شده یا از قبل در صف است
+            if job["id"] in self._jobs or job["id"] in self._done:
+                continue
+            self._add(job)
+            added += 1
+
+        if added:
+            self._wake.set()
+
+    def prune(self):
+        """پاک‌کردن نشانه‌های اتمامِ قدیمی‌تر از done_ttl."""
+        before = time.time() - self.done_ttl
+        self._set_done({k: t for k, t in self._done.items() if t >= before})
+        storage_submit(get_backend().prune_done, before)
+
+    def cancel_posts(self, keys: set[tuple[int, int]]):
+        """
+        لغو jobهای در صف پست‌های (source, message_id) داده‌شده (مثلاً پست خاموش‌شده).
+        نشانه‌ی اتمام ثبت نمی‌شود تا با روشن‌شدن دوباره‌ی پست، ارسالش برنامه‌ریزی شود.
+        """
+        jobs = [
+            j for j in self._jobs.values()
+            if (j["source"], j["message_id"]) in keys and j["id"] not in self._inflight
+        ]
+        if not jobs:
+            return
+
+        for j in jobs:
+            self._forget(j)
+        storage_submit(get_backend().delete_jobs, [j["id"] for j in jobs])
+        log.info("cancelled jobs of inactive posts", jobs=len(jobs))
+
+    def new_cycle(self, chat_id: int, cycle: int):
+        """
+        شروع چرخه‌ی جدید یک مقصد در scheduler:
+        نشانه‌های اتمام چرخه‌های قبلی همین مقصد دیگر لازم نیستند
+        (فقط چرخه‌ی جاری نباید تکرار شود) و حذف می‌شوند.
+        نشانه‌های ارسال یکبار (once) تا done_ttl می‌مانند.
+        """
+        keep = str(cycle)
+        ids = [
+            k for k in self._done_by_chat.get(chat_id, ())
+            if k.partition(":")[0] not in (keep, "once")
+        ]
+        if not ids:
+            return
+
+        for k in ids:
+            self._unmark_done(k)
+        storage_submit(get_backend().delete_done, ids)
+
+    def _set_done(self, done: dict[str, float]):
+        self._done = done
+        self._done_by_chat = {}
+        for k in done:
+            self._done_by_chat.setdefault(_chat_of(k), set()).add(k)
+
+    def _mark_done(self, job_id: str, now: float):
+        self._done[job_id] = now
+        self._done_by_chat.setdefault(_chat_of(job_id), set()).add(job_id)
+
+    def _unmark_done(self, job_id: str):
+        self._done.pop(job_id, None)
+        chat_id = _chat_of(job_id)
+        ids = self._done_by_chat.get(chat_id)
+        if ids is not None:
+            ids.discard(job_id)
+            if not ids:
+                del self._done_by_chat[chat_id]
+
+    # ---- پردازش ---- #
+    def _pop_due(self, now: float):
+        while self._heap:
+            due_at, job_id = self._heap[0]
+            job = self._jobs.get(job_id)
+
+            # ورودی کهنه (job تمام شده، زمانش عوض شده یا در حال ارسال گروهی است)
+            if job is None or job["due_at"] != due_at or job_id in self._inflight:
+                heapq.heappop(self._heap)
+                continue
+
+            if due_at > now:
+                return None, due_at
+
+            heapq.heappop(self._heap)
+            return job, None
+
+        return None, None
+
+    def _take_batch(self, job: dict, now: float) -> list[dict]:
+        """
+        job به‌همراه بقیه‌ی jobهای سررسیده‌ی همان مقصد و همان منبع
+        (حداکثر COPY_BATCH و حداکثر ظرفیت bucket همان چت، تا یک copyMessages
+        بیشتر از سهم چت پیام نفرستد).
+        copyMessages شناسه‌ها را به ترتیب صعودی می‌خواهد
+        (پیام‌های یک آلبوم پشت‌سرهم هستند و کنار هم می‌مانند).
+        """
+        batch = [job]
+        size = len(_ids(job))
+        source = job["source"]
+
+        if self._deliver_many is not None:
+            limit = min(COPY_BATCH, self._route(job["chat_id"])[1].burst(job["chat_id"]))
+            for other in self._by_chat.get(job["chat_id"], {}).values():
+                if other is job or other["id"] in self._inflight or other["due_at"] > now:
+                    continue
+                if other["source"] != source:
+                    continue
+                if size + len(_ids(other)) > limit:
+                    break
+                batch.append(other)
+                size += len(_ids(other))
+
+        for j in batch:
+            self._inflight.add(j["id"])
+
+        batch.sort(key=lambda j: j["message_id"])
+        return batch
+
+    def _finish(self, job: dict, result: str = "ok"):
+        now = time.time()
+
+        DELIVERIES.inc(result)
+        if result == "ok":
+            DELIVERY_LAG.observe(max(0.0, now - job["due_at"]))
+
+        self._forget(job)
+        self._mark_done(job["id"], now)
+
+        storage_submit(get_backend().complete_job, job["id"], now)
+
+    def _forget(self, job: dict):
+        """خارج‌کردن job از حافظه (ورودی heap کهنه می‌شود)."""
+        self._jobs.pop(job["id"], None)
+        self._pairs.pop((job["source"], job["message_id"], job["chat_id"]), None)
+
+        chat_jobs = self._by_chat.get(job["chat_id"])
+        if chat_jobs is not None:
+            chat_jobs.pop(job["id"], None)
+            if not chat_jobs:
+                del self._by_chat[job["chat_id"]]
+
+    def _route(self, chat_id: int) -> tuple[Bot, DeliveryEngine]:
+        # با استخر ربات‌ها → ربات و موتور مخصوص این مقصد
+        if self._pool is not None:
+            return self._pool.route(chat_id)
+        return self._bot, self.engine
+
+    def _defer(self, job: dict, due_at: float):
+        """عقب‌انداختن job تا پایان backoff مقصد (بدون شمردن تلاش)."""
+        job["due_at"] = due_at
+        storage_submit(get_backend().save_job, dict(job))
+        heapq.heappush(self._heap, (due_at, job["id"]))
+
+    async def _gate(self, batch: list[dict]) -> bool:
+        """
+        مقصد حذف‌شده یا قرنطینه‌شده → jobها کنار گذاشته می‌شوند.
+        مقصد در backoff → jobها تا retry_at عقب می‌افتند.
+        مقصد به worker دیگری رسیده → jobها فقط از حافظه خارج می‌شوند.
+        خروجی True یعنی می‌شود ارسال کرد.
+        """
+        if not CLUSTER.owns(batch[0]["chat_id"]):
+            for j in batch:
+                self._forget(j)
+            return False
+
+        dest = await storage_run(get_destination, batch[0]["chat_id"])
+        if dest is None:
+            for j in batch:
+                self._finish(j, "dropped")
+            return False
+
+        if is_quarantined(dest):
+            for j in batch:
+                self._finish(j, "skipped")
+            return False
+
+        wait = retry_at(dest)
+        if wait > time.time():
+            for j in batch:
+                self._defer(j, wait)
+            return False
+
+        return True
+
+    def _retry(self, job: dict, error: Exception):
+        job["attempt"] += 1
+        API_ERRORS.inc("outbox", type(error).__name__)
+
+        if job["attempt"] >= self.max_attempts:
+            log.error(
+                "give up", msg_id=job["message_id"], dest=job["chat_id"], attempt=job["attempt"],
+                error=type(error).__name__, detail=str(error)
+            )
+            self._finish(job, "gave_up")
+            return
+
+        DELIVERIES.inc("retry")
+
+        delay = min(self.backoff_max, self.backoff_base ** job["attempt"])
+        job["due_at"] = time.time() + delay
+
+        storage_submit(get_backend().save_job, dict(job))
+        heapq.heappush(self._heap, (job["due_at"], job["id"]))
+
+        log.warning(
+            "retry", msg_id=job["message_id"], dest=job["chat_id"], attempt=job["attempt"],
+            delay=round(delay), error=type(error).__name__, detail=str(error)
+        )
+
+    async def _run(self, job: dict):
+        ids = _ids(job)
+        source = job["source"]
+        bot, engine = self._route(job["chat_id"])
+
+        if len(ids) > 1 and self._deliver_many is not None:
+            # آلبوم → همیشه یک copyMessages تا گروهی بماند
+            fn = lambda: self._deliver_many(bot, ids, job["chat_id"], source)
+        elif len(ids) > 1:
+            # بدون deliver_many → پیام‌های آلبوم تک‌تک (گروه‌بندی حفظ نمی‌شود)
+            async def fn():
+                return [await self._deliver(bot, m, job["chat_id"], source) for m in ids]
+        else:
+            fn = lambda: self._deliver(bot, job["message_id"], job["chat_id"], source)
+
+        try:
+            copied = await engine.call(job["chat_id"], fn, cost=len(ids))
+        except PERMANENT_ERRORS as e:
+            log.warning(
+                "drop", msg_id=job["message_id"], dest=job["chat_id"],
+                error=type(e).__name__, detail=str(e)
+            )
+            API_ERRORS.inc("outbox", type(e).__name__)
+            if _dest_gone(e):
+                storage_submit(record_failure, job["chat_id"], e, permanent=True, now=time.time())
+            self._finish(job, "dropped")
+        except Exception as e:
+            storage_submit(record_failure, job["chat_id"], e, permanent=False, now=time.time())
+            self._retry(job, e)
+        else:
+            self._finish(job)
+            storage_submit(record_copies, job["chat_id"], source, ids, copied)
+            storage_submit(record_success, job["chat_id"], time.time())
+
+    async def _run_batch(self, batch: list[dict]):
+        if not await self._gate(batch):
+            return
+
+        if len(batch) == 1:
+            return await self._run(batch[0])
+
+        chat_id = batch[0]["chat_id"]
+        source = batch[0]["source"]
+        ids = [m for j in batch for m in _ids(j)]
+        bot, engine = self._route(chat_id)
+
+        try:
+            copied = await engine.call(
+                chat_id,
+                lambda: self._deliver_many(bot, ids, chat_id, source),
+                cost=len(ids)
+            )
+        except Exception as e:
+            if _dest_gone(e):
+                # خود مقصد از دسترس خارج شده → تک‌تک فرستادن هم فایده ندارد
+                log.warning(
+                    "drop batch", msg_id=ids[0], msgs=len(ids), dest=chat_id,
+                    error=type(e).__name__, detail=str(e)
+                )
+                API_ERRORS.inc("outbox", type(e).__name__)
+                storage_submit(record_failure, chat_id, e, permanent=True, now=time.time())
+                for j in batch:
+                    self._finish(j, "dropped")
+                return
+
+            if not isinstance(e, TelegramBadRequest):
+                # خطای موقت (شبکه، 5xx) → یک خطا برای مقصد و تلاش دوباره‌ی همه‌ی jobها
+                # (ارسال تک‌تک هم به همان دلیل شکست می‌خورد)
+                storage_submit(record_failure, chat_id, e, permanent=False, now=time.time())
+                for j in batch:
+                    self._retry(j, e)
+                return
+
+            # یکی از پیام‌ها مشکل دارد → تک‌تک با همان منطق retry
+            log.warning(
+                "batch failed, falling back to single copies", msg_id=ids[0], msgs=len(ids),
+                dest=chat_id, error=type(e).__name__, detail=str(e)
+            )
+            for j in batch:
+                # مقصد در همین فاصله قرنطینه یا در backoff رفته → بقیه کنار/عقب می‌روند
+                if not await self._gate([j]):
+                    continue
+                await self._run(j)
+        else:
+            for j in batch:
+                self._finish(j)
+            storage_submit(record_copies, chat_id, source, ids, copied)
+            storage_submit(record_success, chat_id, time.time())
+
+    async def _worker(self):
+        while True:
+            now = time.time()
+            job, next_due = self._pop_due(now)
+
+            if job is None:
+                self._wake.clear()
+                timeout = None if next_due is None else max(0.0, next_due - time.time())
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = self._take_batch(job, now)
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                log.exception("worker failed", error=type(e).__name__)
+            finally:
+                for j in batch:
+                    self._inflight.discard(j["id"])
+
+    # ---- شروع / توقف ---- #
+    def start(self, bot: Bot, deliver: Deliver, deliver_many: DeliverMany | None = None, pool=None):
+        """
+        pool → استخر ربات‌های ارسال (app.botpool)؛ بدون آن همه با bot و engine ارسال می‌شوند.
+        """
+        if not self._loaded:
+            self.load()
+
+        self._bot = bot
+        self._pool = pool
+        self._deliver = deliver
+        self._deliver_many = deliver_many
+
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+        log.info("workers started", workers=self.workers)
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+# صف مشترک scheduler و ارسال یکبار
+OUTBOX = Outbox()
+QUEUE_DEPTH.func = OUTBOX.depth
@@ -0,0 +1,47 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+
+
+# ---------------------- پروفایل روی پروسه‌ی زنده ---------------------- #
+# cProfile روی thread اصلی (event loop) فعال می‌شود، به تعداد ثانیه‌ی خواسته‌شده
+# ربات عادی کار می‌کند و بعد پرهزینه‌ترین توابع (cumulative و tottime) گزارش می‌شوند.
+# کار thread ذخیره‌سازی و thread لاگ در این گزارش نیست.
+
+MAX_SECONDS = 300
+
+_LOCK = asyncio.Lock()
+
+
+def is_running() -> bool:
+    return _LOCK.locked()
+
+
+async def profile(seconds: float, top: int = 40) -> str:
+    """
+    پروفایل event loop به مدت seconds ثانیه؛ خروجی: گزارش متنی.
+    هم‌زمان فقط یک پروفایل اجرا می‌شود.
+    """
+    seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+
+    async with _LOCK:
+        prof = cProfile.Profile()
+        started = time.time()
+
+        prof.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+
+    out = io.StringIO()
+    out.write(f"profile: {seconds:.0f}s from {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))}\n\n")
+
+    for key in ("cumulative", "tottime"):
+        out.write(f"==================== top {top} by {key} ====================\n")
+        stats = pstats.Stats(prof, stream=out)
+        stats.strip_dirs().sort_stats(key).print_stats(top)
+
+    return out.getvalue()
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+
+# ---------------------- Token Bucket ---------------------- #
+
+class TokenBucket:
+    """
+    محدودکننده‌ی نرخ ساده:
+    - rate     → تعداد توکن در هر ثانیه
+    - capacity → حداکثر ارسال پشت‌سرهم (burst)
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1):
+        """
+        گرفتن tokens توکن (برای ارسال گروهی بیشتر از یک).
+        مقدار بیشتر از capacity کامل حساب می‌شود: بعد از پر شدن bucket برداشته می‌شود
+        و کسری آن به‌صورت بدهی (توکن منفی) از ارسال‌های بعدی کم می‌شود.
+        """
+        need = min(tokens, self.capacity)
+
+        while True:
+            now = time.monotonic()
+
+            # توقف اجباری بعد از 429
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+
+            self._refill(now)
+
+            if self.tokens >= need:
+                self.tokens -= tokens
+                return
+
+            await asyncio.sleep((need - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        تا seconds ثانیه هیچ توکنی داده نمی‌شود (برای TelegramRetryAfter).
+        """
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
@@ -1,39 +1,37 @@
-import json
-from pathlib import Path
-
-DATA = Path("/tmp/forward_admins.json")
+from app.events import CHANGES
+from app.storage.backend import get_backend
 
 # مقدار Owner توسط bootstrap_admins مقداردهی می‌شود
 OWNER_ID: int = 0
 
+# تنها مرجع ادمین‌ها: یک‌بار از backend خوانده می‌شود
+# و فقط با add_admin / remove_admin دوباره ساخته می‌شود
+_ADMINS: frozenset[int] | None = None
+
 
 # ---------------------- ابزارهای داخلی ---------------------- #
 
-def _load() -> set[int]:
+def _load() -> frozenset[int]:
     """
-    خواندن لیست ادمین‌ها از فایل.
-    فایل JSON باید شامل یک لیست از اعداد باشد.
+    لیست ادمین‌ها از حافظه (در اولین فراخوانی از backend).
     """
-    if DATA.exists():
-        try:
-            raw = json.loads(DATA.read_text(encoding="utf-8"))
-            return {int(x) for x in raw}
-        except:
-            return set()
-    return set()
+    global _ADMINS
+
+    if _ADMINS is None:
+        _ADMINS = frozenset(get_backend().load_admins())
+    return _ADMINS
+
 
+def _invalidate():
+    global _ADMINS
+    _ADMINS = None
 
-def _save(admins: set[int]):
+
+def reload_admins():
     """
-    ذخیره‌سازی لیست ادمین‌ها روی دیسک.
+    خواندن دوباره از backend (تغییر ادمین‌ها در پروسه‌ی دیگر).
     """
-    try:
-        DATA.write_text(
-            json.dumps(sorted(list(admins)), ensure_ascii=False),
-            encoding="utf-8"
-        )
-    except:
-        pass
+    _invalidate()
 
 
 # ---------------------- آماده‌سازی اولیه ---------------------- #
@@ -43,17 +41,20 @@ def bootstrap_admins(owner_id: int, initial_admins: set[int]):
     در ابتدای اجرای ربات فراخوانی می‌شود.
     - Owner را تنظیم می‌کند
     - ادمین‌های اولیه (از .env) را اضافه می‌کند
-    - فایل قدیمی را بارگذاری می‌کند
+    - لیست ذخیره‌شده‌ی قبلی را بارگذاری می‌کند
     """
     global OWNER_ID
 
     OWNER_ID = int(owner_id)
 
+    backend = get_backend()
     admins = _load()
-    admins.update(initial_admins)
-    admins.add(OWNER_ID)  # Owner همیشه ادمین است
 
-    _save(admins)
+    for uid in set(initial_admins) | {OWNER_ID}:  # Owner همیشه ادمین است
+        if uid not in admins:
+            backend.save_admin(uid)
+
+    _invalidate()
 
 
 # ---------------------- API عمومی ---------------------- #
@@ -70,8 +71,7 @@ def is_admin(uid: int) -> bool:
     """
     بررسی اینکه آیا uid ادمین است یا خیر.
     """
-    admins = _load()
-    return uid in admins or uid == OWNER_ID
+    return uid == OWNER_ID or uid in _load()
 
 
 def add_admin(uid: int) -> bool:
@@ -87,8 +87,9 @@ def add_admin(uid: int) -> bool:
     if uid in admins:
         return False
 
-    admins.add(uid)
-    _save(admins)
+    get_backend().save_admin(uid)
+    _invalidate()
+    CHANGES.publish("admins")
     return True
 
 
@@ -107,6 +108,7 @@ def remove_admin(uid: int) -> bool:
     if uid not in admins:
         return False
 
-    admins.remove(uid)
-    _save(admins)
+    get_backend().delete_admin(uid)
+    _invalidate()
+    CHANGES.publish("admins")
     return True
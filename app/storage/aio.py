@@ -0,0 +1,100 @@
+import asyncio
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+import settings_storage
+from app.storage import admins, copies, dests, posts
+from app.log import get_logger
+from app.storage.backend import get_backend
+
+log = get_logger("storage")
+
+
+# ---------------------- API ناهمگام ذخیره‌سازی ---------------------- #
+# handlerها و scheduler به‌جای توابع هم‌گام، همین‌ها را await می‌کنند
+# و outbox نوشتن‌های پرتعدادش را با submit (بدون انتظار) می‌فرستد:
+# - backend با کار مستقیم دیسک/دیتابیس (SQLite) → در یک thread اختصاصی ذخیره‌سازی
+#   (یک thread → نوشتن‌ها و read-modify-writeها مثل سلامت مقصدها به ترتیب و بدون تداخل اجرا می‌شوند)
+# - backend درون حافظه (JSON) → همان‌جا اجرا می‌شود؛ خواندن از حافظه است و
+#   نوشتن روی دیسک از قبل تجمیعی و در thread جداست
+# کش‌ها (پست‌ها، مسیرها، ادمین‌ها، تنظیمات) در حالت SQLite روی همین thread پر و عوض می‌شوند،
+# ولی event loop هم بعضی را مستقیم می‌خواند (مثلاً is_admin در middleware)؛
+# این کش‌ها هنگام تغییر کامل جایگزین می‌شوند (نه تغییر درجا) تا خواننده نسخه‌ی نیمه‌کاره نبیند.
+
+EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+
+
+async def run(fn: Callable, *args, **kwargs) -> Any:
+    """اجرای یک تابع ذخیره‌سازی بدون بلاک‌کردن event loop."""
+    if not get_backend().blocking:
+        return fn(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+def _report(future: Future):
+    error = future.exception()
+    if error is not None:
+        log.error("storage write failed", error=type(error).__name__, detail=str(error))
+
+
+def submit(fn: Callable, *args, **kwargs):
+    """
+    نوشتن بدون انتظار (برای مسیر پرتکرار outbox)؛
+    ترتیبش با بقیه‌ی کارهای thread ذخیره‌سازی حفظ می‌شود.
+    """
+    if not get_backend().blocking:
+        fn(*args, **kwargs)
+        return
+
+    EXECUTOR.submit(fn, *args, **kwargs).add_done_callback(_report)
+
+
+def _wrap(fn: Callable) -> Callable:
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+def close():
+    """صبر برای نوشتن‌های در صف (برای خاموش‌شدن ربات)."""
+    EXECUTOR.shutdown(wait=True)
+
+
+# ---- پست‌ها ---- #
+add_post = _wrap(posts.add_post)
+list_today_posts = _wrap(posts.list_today_posts)
+toggle_post = _wrap(posts.toggle_post)
+mark_sent_once = _wrap(posts.mark_sent_once)
+is_sent_once = _wrap(posts.is_sent_once)
+rollover = _wrap(posts.rollover)
+
+# ---- مقصدها ---- #
+is_source = _wrap(dests.is_source)
+list_sources = _wrap(dests.list_sources)
+route_destinations = _wrap(dests.route_destinations)
+set_destination_sources = _wrap(dests.set_destination_sources)
+add_destination = _wrap(dests.add_destination)
+remove_destination = _wrap(dests.remove_destination)
+list_destinations = _wrap(dests.list_destinations)
+list_active_destinations = _wrap(dests.list_active_destinations)
+update_destination = _wrap(dests.update_destination)
+list_quarantined = _wrap(dests.list_quarantined)
+reinstate_destination = _wrap(dests.reinstate_destination)
+
+# ---- ادمین‌ها ---- #
+list_admins = _wrap(admins.list_admins)
+add_admin = _wrap(admins.add_admin)
+remove_admin = _wrap(admins.remove_admin)
+
+# ---- کپی‌ها ---- #
+get_copies = _wrap(copies.get_copies)
+
+# ---- تنظیمات ---- #
+get_send_mode = _wrap(settings_storage.get_send_mode)
+set_send_mode = _wrap(settings_storage.set_send_mode)
+get_interval = _wrap(settings_storage.get_interval)
+set_interval_value = _wrap(settings_storage.set_interval_value)
@@ -0,0 +1,417 @@
+import gzip
+from pathlib import Path
+from typing import Any
+
+from app.config import SETTINGS
+from app.log import get_logger
+from app.storage.jsonfile import JsonFile, atomic_write_bytes
+
+log = get_logger("storage")
+
+
+def post_key(post: dict) -> tuple[int, int]:
+    """کلید یکتای پست: (کانال منبع، message_id)"""
+    return post["source"], post["message_id"]
+
+
+# ---------------------- رابط مشترک ذخیره‌سازی ---------------------- #
+
+class StorageBackend:
+    """
+    رابط مشترک بین ماژول‌های posts / dests / admins / settings
+    و محل واقعی ذخیره‌سازی (JSON یا SQLite).
+    هر متد فقط یک ردیف را تغییر می‌دهد.
+    """
+
+    # True → هر فراخوانی مستقیماً دیسک/دیتابیس را می‌خواند یا می‌نویسد
+    # (app.storage.aio آن را در thread ذخیره‌سازی اجرا می‌کند)
+    blocking = True
+
+    # ---- پست‌ها (تقسیم‌شده بر اساس روز) ---- #
+    def load_posts(self, since: str | None = None) -> list[dict]:
+        """پست‌های روزهای >= since (None → همه‌ی روزهای فعال)."""
+        raise NotImplementedError
+
+    def save_post(self, post: dict):
+        raise NotImplementedError
+
+    def list_post_days(self) -> list[str]:
+        raise NotImplementedError
+
+    def archive_post_day(self, day: str, mode: str = "gzip"):
+        """
+        خارج‌کردن یک روز از بخش فعال:
+        gzip → فشرده در آرشیو ، delete → حذف کامل
+        """
+        raise NotImplementedError
+
+    # ---- مقصدها ---- #
+    def load_dests(self) -> list[dict]:
+        raise NotImplementedError
+
+    def get_dest(self, chat_id: int) -> dict | None:
+        raise NotImplementedError
+
+    def save_dest(self, dest: dict):
+        raise NotImplementedError
+
+    def delete_dest(self, chat_id: int) -> bool:
+        raise NotImplementedError
+
+    # ---- ادمین‌ها ---- #
+    def load_admins(self) -> set[int]:
+        raise NotImplementedError
+
+    def save_admin(self, uid: int):
+        raise NotImplementedError
+
+    def delete_admin(self, uid: int):
+        raise NotImplementedError
+
+    # ---- تنظیمات ---- #
+    def load_settings(self) -> dict:
+        raise NotImplementedError
+
+    def save_setting(self, key: str, value: Any):
+        raise NotImplementedError
+
+    # ---- صف ارسال (outbox) ---- #
+    def load_jobs(self) -> list[dict]:
+        raise NotImplementedError
+
+    def save_job(self, job: dict):
+        raise NotImplementedError
+
+    def complete_job(self, job_id: str, done_at: float):
+        """حذف job و ثبت نشانه‌ی اتمام آن (در یک مرحله)."""
+        raise NotImplementedError
+
+    def delete_jobs(self, job_ids: list[str]):
+        """حذف jobها بدون ثبت نشانه‌ی اتمام (لغو)."""
+        raise NotImplementedError
+
+    def delete_chat_jobs(self, chat_id: int) -> int:
+        """حذف همه‌ی jobهای در صف یک مقصد (مثلاً بعد از حذف آن)؛ خروجی: تعداد"""
+        raise NotImplementedError
+
+    def load_done(self) -> dict[str, float]:
+        raise NotImplementedError
+
+    def prune_done(self, before: float):
+        raise NotImplementedError
+
+    def delete_done(self, job_ids: list[str]):
+        raise NotImplementedError
+
+    # ---- نقشه‌ی کپی‌ها (پیام منبع → پیام کپی‌شده در هر مقصد) ---- #
+    def save_copies(self, chat_id: int, source: int, copies: dict[int, int]):
+        """
+        copies → message_id در کانال source -> copied message_id در chat_id
+        (به کپی‌های قبلی همان پیام در همان مقصد اضافه می‌شود)
+        """
+        raise NotImplementedError
+
+    def load_copies(self, source: int, message_id: int) -> dict[int, list[int]]:
+        """chat_id -> همه‌ی copied message_idها (به ترتیب ارسال)"""
+        raise NotImplementedError
+
+    def delete_copies(self, keys: list[tuple[int, int]]):
+        """keys → (source, message_id)"""
+        raise NotImplementedError
+
+    # ---- عمومی ---- #
+    def flush(self):
+        """ذخیره‌ی فوری هر تغییری که هنوز روی دیسک نرفته."""
+
+
+# ---------------------- پیاده‌سازی JSON (پیش‌فرض) ---------------------- #
+
+class JsonBackend(StorageBackend):
+    """
+    فایل‌های JSON ربات:
+    storage/posts/YYYY-MM-DD.json (یک فایل برای هر روز) ،
+    storage/posts/archive/YYYY-MM-DD.json.gz (روزهای بایگانی‌شده) ،
+    storage/fwd_dests.json ، storage/fwd_settings.json ، storage/fwd_admins.json
+    و storage/fwd_copies.json
+    """
+
+    # خواندن از حافظه، نوشتن تجمیعی و در thread جدا → بدون انتقال به thread ذخیره‌سازی
+    blocking = False
+
+    # مسیر قدیمی ادمین‌ها (بعد از ری‌استارت کانتینر پاک می‌شد)
+    LEGACY_ADMINS = Path("/tmp/forward_admins.json")
+
+    def __init__(self, base: Path = Path("storage")):
+        base.mkdir(parents=True, exist_ok=True)
+        admins_path = base / "fwd_admins.json"
+
+        self.legacy_posts = base / "fwd_posts.json"
+        self.posts_dir = base / "posts"
+        self.archive_dir = self.posts_dir / "archive"
+        self.posts_dir.mkdir(parents=True, exist_ok=True)
+        self.dests_file = JsonFile(base / "fwd_dests.json", list)
+        self.settings_file = JsonFile(base / "fwd_settings.json", dict)
+        self.admins_file = JsonFile(admins_path, list)
+        self.outbox_file = JsonFile(base / "fwd_outbox.json", dict)
+        self.copies_file = JsonFile(base / "fwd_copies.json", dict)
+
+        self._days: dict[str, dict[tuple[int, int], dict]] = {}
+        self._day_files: dict[str, JsonFile] = {}
+        self._dests: dict[int, dict] | None = None
+        self._admins: set[int] | None = None
+        self._settings: dict | None = None
+        self._outbox: dict | None = None
+        self._copies: dict[tuple[int, int], dict[int, list[int]]] | None = None
+
+    # ---- پست‌ها (یک فایل برای هر روز) ---- #
+    def _day_file(self, day: str) -> JsonFile:
+        f = self._day_files.get(day)
+        if f is None:
+            f = self._day_files[day] = JsonFile(self.posts_dir / f"{day}.json", list)
+        return f
+
+    def _day_map(self, day: str) -> dict[tuple[int, int], dict]:
+        posts = self._days.get(day)
+        if posts is None:
+            posts = self._days[day] = {post_key(p): p for p in self._day_file(day).load()}
+        return posts
+
+    def _migrate_legacy(self):
+        """تقسیم fwd_posts.json قدیمی به فایل‌های روزانه (یک‌بار)."""
+        if not self.legacy_posts.exists():
+            return
+
+        by_day: dict[str, list[dict]] = {}
+        for p in JsonFile(self.legacy_posts, list).load():
+            # fwd_posts.json فقط یک منبع داشت
+            p.setdefault("source", SETTINGS.SOURCE_CHANNEL_ID)
+            by_day.setdefault(p["date"], []).append(p)
+
+        for day, posts in by_day.items():
+            merged = self._day_map(day)
+            for p in posts:
+                merged.setdefault(post_key(p), p)
+            self._day_file(day).save(list(merged.values()))
+
+        self.legacy_posts.replace(self.legacy_posts.with_name("fwd_posts.json.migrated"))
+        log.info("split fwd_posts.json into daily files", days=len(by_day))
+
+    def list_post_days(self) -> list[str]:
+        self._migrate_legacy()
+        return sorted(p.stem for p in self.posts_dir.glob("*.json"))
+
+    def load_posts(self, since: str | None = None) -> list[dict]:
+        posts = []
+        for day in self.list_post_days():
+            if since is None or day >= since:
+                posts.extend(self._day_map(day).values())
+        return posts
+
+    def save_post(self, post: dict):
+        posts = self._day_map(post["date"])
+        posts[post_key(post)] = post
+        self._day_file(post["date"]).schedule(lambda: list(posts.values()))
+
+    def archive_post_day(self, day: str, mode: str = "gzip"):
+        f = self._day_file(day)
+        f.flush()
+
+        if mode == "gzip" and f.path.exists():
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_bytes(
+                self.archive_dir / f"{day}.json.gz",
+                gzip.compress(f.path.read_bytes())
+            )
+
+        f.path.unlink(missing_ok=True)
+        self._days.pop(day, None)
+        self._day_files.pop(day, None)
+
+    # ---- مقصدها ---- #
+    def _dests_map(self) -> dict[int, dict]:
+        if self._dests is None:
+            self._dests = {d["chat_id"]: d for d in self.dests_file.load()}
+        return self._dests
+
+    def load_dests(self) -> list[dict]:
+        return list(self._dests_map().values())
+
+    def get_dest(self, chat_id: int) -> dict | None:
+        return self._dests_map().get(chat_id)
+
+    def save_dest(self, dest: dict):
+        dests = self._dests_map()
+        dests[dest["chat_id"]] = dest
+        self.dests_file.schedule(lambda: list(dests.values()))
+
+    def delete_dest(self, chat_id: int) -> bool:
+        dests = self._dests_map()
+        if dests.pop(chat_id, None) is None:
+            return False
+        self.dests_file.schedule(lambda: list(dests.values()))
+        return True
+
+    # ---- ادمین‌ها ---- #
+    def load_admins(self) -> set[int]:
+        if self._admins is None:
+            f = self.admins_file
+            if not f.path.exists() and self.LEGACY_ADMINS.exists():
+                f = JsonFile(self.LEGACY_ADMINS, list)
+            try:
+                self._admins = {int(x) for x in f.load()}
+            except:
+                self._admins = set()
+        return set(self._admins)
+
+    def save_admin(self, uid: int):
+        self.load_admins()
+        self._admins.add(int(uid))
+        self.admins_file.schedule(lambda: sorted(self._admins))
+
+    def delete_admin(self, uid: int):
+        self.load_admins()
+        self._admins.discard(int(uid))
+        self.admins_file.schedule(lambda: sorted(self._admins))
+
+    # ---- تنظیمات ---- #
+    def load_settings(self) -> dict:
+        if self._settings is None:
+            self._settings = self.settings_file.load()
+        return dict(self._settings)
+
+    def save_setting(self, key: str, value: Any):
+        self.load_settings()
+        self._settings[key] = value
+        self.settings_file.schedule(lambda: self._settings)
+
+    # ---- صف ارسال (outbox) ---- #
+    def _outbox_data(self) -> dict:
+        if self._outbox is None:
+            raw = self.outbox_file.load()
+            self._outbox = {
+                "jobs": {j["id"]: j for j in raw.get("jobs", [])},
+                "done": dict(raw.get("done", {})),
+            }
+        return self._outbox
+
+    def _schedule_outbox(self):
+        data = self._outbox
+        self.outbox_file.schedule(lambda: {
+            "jobs": list(data["jobs"].values()),
+            "done": data["done"],
+        })
+
+    def load_jobs(self) -> list[dict]:
+        return list(self._outbox_data()["jobs"].values())
+
+    def save_job(self, job: dict):
+        self._outbox_data()["jobs"][job["id"]] = job
+        self._schedule_outbox()
+
+    def complete_job(self, job_id: str, done_at: float):
+        data = self._outbox_data()
+        data["jobs"].pop(job_id, None)
+        data["done"][job_id] = done_at
+        self._schedule_outbox()
+
+    def delete_jobs(self, job_ids: list[str]):
+        jobs = self._outbox_data()["jobs"]
+        for k in job_ids:
+            jobs.pop(k, None)
+        self._schedule_outbox()
+
+    def delete_chat_jobs(self, chat_id: int) -> int:
+        jobs = self._outbox_data()["jobs"]
+        ids = [k for k, j in jobs.items() if j["chat_id"] == chat_id]
+        for k in ids:
+            del jobs[k]
+        if ids:
+            self._schedule_outbox()
+        return len(ids)
+
+    def load_done(self) -> dict[str, float]:
+        return dict(self._outbox_data()["done"])
+
+    def prune_done(self, before: float):
+        data = self._outbox_data()
+        data["done"] = {k: t for k, t in data["done"].items() if t >= before}
+        self._schedule_outbox()
+
+    def delete_done(self, job_ids: list[str]):
+        done = self._outbox_data()["done"]
+        for k in job_ids:
+            done.pop(k, None)
+        self._schedule_outbox()
+
+    # ---- نقشه‌ی کپی‌ها ---- #
+    # کلید فایل: "source:message_id"
+    @staticmethod
+    def _copy_key(raw: str) -> tuple[int, int]:
+        source, mid = raw.split(":")
+        return int(source), int(mid)
+
+    def _copies_map(self) -> dict[tuple[int, int], dict[int, list[int]]]:
+        if self._copies is None:
+            self._copies = {
+                self._copy_key(k): {int(c): ids for c, ids in chats.items()}
+                for k, chats in self.copies_file.load().items()
+            }
+        return self._copies
+
+    def _schedule_copies(self):
+        copies = self._copies
+        self.copies_file.schedule(lambda: {
+            f"{s}:{m}": {str(c): ids for c, ids in chats.items()}
+            for (s, m), chats in copies.items()
+        })
+
+    def save_copies(self, chat_id: int, source: int, copies: dict[int, int]):
+        data = self._copies_map()
+        for mid, cid in copies.items():
+            ids = data.setdefault((source, mid), {}).setdefault(chat_id, [])
+            if cid not in ids:
+                ids.append(cid)
+        self._schedule_copies()
+
+    def load_copies(self, source: int, message_id: int) -> dict[int, list[int]]:
+        return {c: list(ids) for c, ids in self._copies_map().get((source, message_id), {}).items()}
+
+    def delete_copies(self, keys: list[tuple[int, int]]):
+        data = self._copies_map()
+        for key in keys:
+            data.pop(tuple(key), None)
+        self._schedule_copies()
+
+    # ---- عمومی ---- #
+    def flush(self):
+        for f in (*self._day_files.values(), self.dests_file, self.settings_file,
+                  self.admins_file, self.outbox_file, self.copies_file):
+            f.flush()
+
+
+# ---------------------- انتخاب backend ---------------------- #
+
+_BACKEND: StorageBackend | None = None
+
+
+def get_backend() -> StorageBackend:
+    """
+    backend فعال بر اساس STORAGE_BACKEND در .env
+    (json یا sqlite)
+    """
+    global _BACKEND
+
+    if _BACKEND is None:
+        if SETTINGS.STORAGE_BACKEND == "sqlite":
+            from app.storage.sqlite_backend import SqliteBackend
+            _BACKEND = SqliteBackend(Path(SETTINGS.SQLITE_PATH))
+        else:
+            _BACKEND = JsonBackend()
+
+    return _BACKEND
+
+
+def set_backend(backend: StorageBackend):
+    """جایگزین‌کردن backend (برای ابزارها و مهاجرت)."""
+    global _BACKEND
+    _BACKEND = backend
@@ -0,0 +1,30 @@
+from app.storage.backend import get_backend
+
+
+# ---------------------- نقشه‌ی کپی‌ها ---------------------- #
+# برای هر پیام کانال منبع (source, message_id): chat_id مقصد -> message_idهای کپی آن در مقصد
+# (در حالت دائمی هر چرخه یک کپی اضافه می‌کند؛ همه تا بایگانی پست در rollover می‌مانند)
+
+def record_copies(chat_id: int, source: int, source_ids: list[int], copied) -> bool:
+    """
+    copied → خروجی copyMessage (یک id) یا copyMessages (لیست id به همان ترتیب).
+    اگر تعداد با source_ids نخواند (بعضی پیام‌ها کپی نشده‌اند) چیزی ثبت نمی‌شود.
+    """
+    if isinstance(copied, int):
+        copied = [copied]
+
+    if not copied or len(copied) != len(source_ids):
+        return False
+
+    get_backend().save_copies(chat_id, source, dict(zip(source_ids, copied)))
+    return True
+
+
+def get_copies(source: int, message_id: int) -> dict[int, list[int]]:
+    return get_backend().load_copies(source, message_id)
+
+
+def forget_copies(keys: list[tuple[int, int]]):
+    """keys → (source, message_id)"""
+    if keys:
+        get_backend().delete_copies(keys)
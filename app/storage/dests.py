@@ -1,56 +1,236 @@
-import json
-from pathlib import Path
+from app.config import SETTINGS
+from app.events import CHANGES
+from app.log import get_logger
+from app.storage.backend import get_backend
 
-# مسیر امن و قابل نوشتن
-BASE = Path("storage")
-BASE.mkdir(parents=True, exist_ok=True)
+log = get_logger("dests")
 
-DATA = BASE / "fwd_dests.json"
 
+# ---------------------- جدول مسیریابی منبع → مقصد ---------------------- #
+# هر مقصد با فیلد sources مشخص می‌کند از کدام کانال‌ها پست بگیرد
+# (بدون sources → فقط منبع پیش‌فرض SOURCE_CHANNEL_ID).
+# فقط منبع‌های تنظیم‌شده در .env منبع‌اند؛ id دیگری در sources نادیده گرفته می‌شود.
+# _ROUTES: source -> chat_idهای مقصدهای فعال ؛ با هر تغییر مقصدها دوباره ساخته می‌شود.
 
-def _load():
-    if DATA.exists():
-        try:
-            return json.loads(DATA.read_text(encoding="utf-8"))
-        except:
-            return []
-    return []
+_ROUTES: dict[int, frozenset[int]] | None = None
 
 
-def _save(data):
-    try:
-        DATA.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    except:
-        pass
+def _changed():
+    reload_routes()
+    CHANGES.publish("dests")
 
 
+def reload_routes():
+    """جدول مسیریابی دوباره ساخته شود (مثلاً بعد از تغییر مقصدها در پروسه‌ی دیگر)."""
+    global _ROUTES
+    _ROUTES = None
+
+
+def configured_sources() -> set[int]:
+    """SOURCE_CHANNEL_ID و SOURCE_CHANNEL_IDS"""
+    return {SETTINGS.SOURCE_CHANNEL_ID} | SETTINGS.SOURCE_CHANNEL_IDS
+
+
+def dest_sources(dest: dict) -> list[int]:
+    return dest.get("sources") or [SETTINGS.SOURCE_CHANNEL_ID]
+
+
+def _routes() -> dict[int, frozenset[int]]:
+    global _ROUTES
+
+    if _ROUTES is None:
+        routes: dict[int, set[int]] = {s: set() for s in configured_sources()}
+        for d in get_backend().load_dests():
+            if is_quarantined(d):
+                continue
+            for s in dest_sources(d):
+                if s in routes:
+                    routes[s].add(d["chat_id"])
+        _ROUTES = {s: frozenset(chats) for s, chats in routes.items()}
+
+    return _ROUTES
+
+
+def is_source(chat_id: int) -> bool:
+    """آیا chat_id یکی از کانال‌های منبع است؟ (O(1))"""
+    return chat_id in _routes()
+
+
+def list_sources() -> dict[int, frozenset[int]]:
+    return dict(_routes())
+
+
+def route_destinations(source: int) -> list[dict]:
+    """مقصدهای فعالی که از source پست می‌گیرند."""
+    backend = get_backend()
+    dests = (backend.get_dest(chat_id) for chat_id in _routes().get(source, ()))
+    return [d for d in dests if d is not None]
+
+
+def set_destination_sources(chat_id: int, sources: list[int] | None) -> bool:
+    """
+    sources خالی → برگشت به منبع پیش‌فرض
+    منبعی خارج از configured_sources → ValueError
+    """
+    unknown = set(sources or ()) - configured_sources()
+    if unknown:
+        raise ValueError(f"not a configured source: {sorted(unknown)}")
+    return update_destination(chat_id, sources=sorted(set(sources)) if sources else None)
+
+
+# ---------------------- مقصدها ---------------------- #
+
 def add_destination(chat_id: int, title: str = "") -> bool:
-    data = _load()
+    backend = get_backend()
 
     # جلوگیری از تکرار
-    for d in data:
-        if d["chat_id"] == chat_id:
-            return False
+    if backend.get_dest(chat_id) is not None:
+        return False
 
-    data.append({
+    backend.save_dest({
         "chat_id": chat_id,
         "title": title or "گروه"
     })
-
-    _save(data)
+    _changed()
     return True
 
 
 def remove_destination(chat_id: int) -> bool:
-    data = _load()
-    new = [d for d in data if d["chat_id"] != chat_id]
+    """حذف مقصد به‌همراه jobهای در صف آن (jobهای در حافظه‌ی outbox هنگام سررسید کنار گذاشته می‌شوند)."""
+    backend = get_backend()
+    ok = backend.delete_dest(chat_id)
+    if ok:
+        dropped = backend.delete_chat_jobs(chat_id)
+        if dropped:
+            log.info("dropped queued jobs", dest=chat_id, jobs=dropped)
+        _changed()
+    return ok
+
+
+def list_destinations():
+    return get_backend().load_dests()
+
+
+def list_active_destinations() -> list[dict]:
+    """مقصدهای خارج از قرنطینه (برای ارسال)."""
+    return [d for d in get_backend().load_dests() if not is_quarantined(d)]
+
+
+def get_destination(chat_id: int) -> dict | None:
+    return get_backend().get_dest(chat_id)
 
-    if len(new) == len(data):
+
+def update_destination(chat_id: int, notify: bool = True, **fields) -> bool:
+    """
+    تغییر فیلدهای یک مقصد (مثلاً interval یا last_cycle_at).
+    مقدار None آن فیلد را حذف می‌کند.
+    notify=False → برای تغییرات داخلی scheduler که نباید خودش را بیدار کند.
+    """
+    backend = get_backend()
+    dest = backend.get_dest(chat_id)
+    if dest is None:
         return False
 
-    _save(new)
+    for key, value in fields.items():
+        if value is None:
+            dest.pop(key, None)
+        else:
+            dest[key] = value
+
+    backend.save_dest(dest)
+    if notify:
+        _changed()
     return True
 
 
-def list_destinations():
-    return _load()
+# ---------------------- سلامت مقصدها ---------------------- #
+# dest["health"] = {
+#   "failures":    تعداد خطاهای پشت‌سرهم
+#   "error":       نوع آخرین خطا
+#   "last_ok":     زمان آخرین ارسال موفق
+#   "retry_at":    تا این زمان ارسال به این مقصد عقب می‌افتد (خطای موقت)
+#   "quarantined": خطای دائمی (ربات اخراج شده، گروه حذف شده، بدون دسترسی ارسال)
+# }
+
+# backoff خطای موقت: BACKOFF_BASE * 2^(failures-1) تا سقف BACKOFF_MAX ثانیه
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+
+# last_ok حداکثر هر چند ثانیه یک‌بار ذخیره می‌شود
+LAST_OK_EVERY = 60
+
+
+def _health(dest: dict) -> dict:
+    return dest.get("health") or {}
+
+
+def is_quarantined(dest: dict) -> bool:
+    return _health(dest).get("quarantined", False)
+
+
+def retry_at(dest: dict) -> float:
+    """تا این زمان نباید به مقصد ارسال شود (0 → آزاد)."""
+    return _health(dest).get("retry_at", 0)
+
+
+def record_success(chat_id: int, now: float):
+    backend = get_backend()
+    dest = backend.get_dest(chat_id)
+    if dest is None:
+        return
+
+    h = _health(dest)
+    if not h.get("failures") and now - h.get("last_ok", 0) < LAST_OK_EVERY:
+        return
+
+    dest["health"] = {"failures": 0, "last_ok": now}
+    backend.save_dest(dest)
+
+
+def record_failure(chat_id: int, error: Exception, permanent: bool, now: float) -> dict | None:
+    """
+    permanent → مقصد قرنطینه می‌شود تا ادمین دوباره فعالش کند.
+    در غیر این صورت ارسال به این مقصد با backoff نمایی عقب می‌افتد.
+    خروجی: وضعیت سلامت جدید
+    """
+    backend = get_backend()
+    dest = backend.get_dest(chat_id)
+    if dest is None:
+        return None
+
+    h = dict(_health(dest))
+    h["failures"] = h.get("failures", 0) + 1
+    h["error"] = type(error).__name__
+    h["detail"] = str(error)[:200]
+
+    if permanent:
+        h["quarantined"] = True
+        h.pop("retry_at", None)
+    else:
+        h["retry_at"] = now + min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (h["failures"] - 1))
+
+    dest["health"] = h
+    backend.save_dest(dest)
+
+    if permanent:
+        log.warning("quarantined", dest=chat_id, error=h["error"], detail=h["detail"])
+        _changed()
+    return h
+
+
+def list_quarantined() -> list[dict]:
+    return [d for d in get_backend().load_dests() if is_quarantined(d)]
+
+
+def reinstate_destination(chat_id: int) -> bool:
+    """خارج‌کردن مقصد از قرنطینه (از پنل مدیریت)."""
+    backend = get_backend()
+    dest = backend.get_dest(chat_id)
+    if dest is None or not is_quarantined(dest):
+        return False
+
+    last_ok = _health(dest).get("last_ok")
+    dest["health"] = {"failures": 0, "last_ok": last_ok} if last_ok else {}
+    backend.save_dest(dest)
+    _changed()
+    return True
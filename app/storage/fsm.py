@@ -0,0 +1,238 @@
+import asyncio
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.config import SETTINGS
+from app.metrics import STORAGE_LATENCY
+
+
+# ---------------------- حالت گفتگو (FSM) با TTL و سقف ---------------------- #
+# هر ورودی با هر خواندن/نوشتن TTL تازه می‌گیرد (sliding TTL)،
+# پس قدیمی‌ترین ورودی در ترتیب LRU همان زودتر منقضی‌شونده است.
+# ورودی بدون state و data نگه داشته نمی‌شود.
+
+def _state_name(state: StateType) -> str | None:
+    return state.state if isinstance(state, State) else state
+
+
+class TTLMemoryStorage(BaseStorage):
+    """
+    FSM درون حافظه با TTL هر ورودی، حذف LRU و سقف max_entries.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> [state, data, expires_at]
+        self._items: OrderedDict[StorageKey, list] = OrderedDict()
+
+    def _get(self, key: StorageKey) -> list | None:
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        now = time.monotonic()
+        if item[2] <= now:
+            del self._items[key]
+            return None
+
+        item[2] = now + self.ttl
+        self._items.move_to_end(key)
+        return item
+
+    def _put(self, key: StorageKey, state: str | None, data: dict):
+        if state is None and not data:
+            self._items.pop(key, None)
+            return
+
+        now = time.monotonic()
+        self._items[key] = [state, data, now + self.ttl]
+        self._items.move_to_end(key)
+
+        # حذف منقضی‌ها و بیشتر از سقف (از قدیمی‌ترین)
+        while self._items:
+            first = next(iter(self._items.values()))
+            if len(self._items) <= self.max_entries and first[2] > now:
+                break
+            self._items.popitem(last=False)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        item = self._get(key)
+        self._put(key, _state_name(state), item[1] if item else {})
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        item = self._get(key)
+        return item[0] if item else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        item = self._get(key)
+        self._put(key, item[0] if item else None, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        item = self._get(key)
+        return dict(item[1]) if item else {}
+
+    async def close(self) -> None:
+        self._items.clear()
+
+
+# set_state / set_data: بخشی که عوض نمی‌شود
+_KEEP = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm_state (
+    key        TEXT PRIMARY KEY,
+    state      TEXT,
+    data       TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm_state(expires_at);
+"""
+
+
+class SqliteStorage(BaseStorage):
+    """
+    FSM در SQLite (حالت WAL) برای اشتراک حالت بین چند پروسه.
+    همان قواعد TTL و سقف max_entries؛ ترتیب LRU بر اساس expires_at است.
+    - همه‌ی کارهای دیتابیس در یک thread اختصاصی (event loop منتظر busy timeout نمی‌ماند)
+    - خواندن فقط وقتی نیمی از TTL گذشته باشد expires_at را تازه می‌کند
+    - حذف منقضی‌ها و بیشتر از سقف حداکثر هر EVICT_EVERY ثانیه یک‌بار
+      (تا آن موقع تعداد ورودی‌ها می‌تواند کمی از سقف بیشتر شود)
+    """
+
+    EVICT_EVERY = 60
+
+    def __init__(self, path: Path, ttl: float, max_entries: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm")
+        self._next_evict = 0.0
+        self._db = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        return db
+
+    def _conn(self) -> sqlite3.Connection:
+        # بعد از close (مثلاً توقف polling هنگام از دست دادن leader) دوباره باز می‌شود
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _get(self, key: StorageKey) -> tuple[str | None, dict] | None:
+        k = self._key(key)
+        now = time.time()
+
+        with self._lock, STORAGE_LATENCY.time("fsm_read"):
+            db = self._conn()
+            row = db.execute(
+                "SELECT state, data, expires_at FROM fsm_state WHERE key = ? AND expires_at > ?", (k, now)
+            ).fetchone()
+            # sliding TTL بدون نوشتن در هر خواندن
+            if row is not None and row[2] - now < self.ttl / 2:
+                db.execute(
+                    "UPDATE fsm_state SET expires_at = ? WHERE key = ?", (now + self.ttl, k)
+                )
+
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _put(self, key: StorageKey, state: str | None, data: dict):
+        k = self._key(key)
+        now = time.time()
+
+        with self._lock, STORAGE_LATENCY.time("fsm_write"):
+            db = self._conn()
+            if state is None and not data:
+                db.execute("DELETE FROM fsm_state WHERE key = ?", (k,))
+                return
+
+            db.execute(
+                "INSERT OR REPLACE INTO fsm_state(key, state, data, expires_at) VALUES (?, ?, ?, ?)",
+                (k, state, json.dumps(data, ensure_ascii=False), now + self.ttl)
+            )
+
+            if now >= self._next_evict:
+                self._next_evict = now + self.EVICT_EVERY
+                self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        """حذف منقضی‌ها و قدیمی‌ترین‌های بیشتر از max_entries (در یک تراکنش)."""
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM fsm_state WHERE expires_at <= ?", (now,))
+            db.execute(
+                "DELETE FROM fsm_state WHERE key IN ("
+                "  SELECT key FROM fsm_state ORDER BY expires_at DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,)
+            )
+        except:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _update(self, key: StorageKey, state=_KEEP, data=_KEEP):
+        """خواندن و نوشتن یک ورودی در یک نوبت thread (فقط بخش داده‌شده عوض می‌شود)."""
+        item = self._get(key)
+        if state is _KEEP:
+            state = item[0] if item else None
+        if data is _KEEP:
+            data = item[1] if item else {}
+        self._put(key, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._run(self._update, key, _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        item = await self._run(self._get, key)
+        return item[0] if item else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await self._run(self._update, key, _KEEP, dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        item = await self._run(self._get, key)
+        return item[1] if item else {}
+
+    async def close(self) -> None:
+        await self._run(self._close)
+
+    def _close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def build_fsm_storage() -> BaseStorage:
+    """
+    storage حالت گفتگو بر اساس FSM_STORAGE در .env (memory یا sqlite)
+    """
+    if SETTINGS.FSM_STORAGE == "sqlite":
+        return SqliteStorage(Path(SETTINGS.SQLITE_PATH), SETTINGS.FSM_TTL, SETTINGS.FSM_MAX_ENTRIES)
+    return TTLMemoryStorage(SETTINGS.FSM_TTL, SETTINGS.FSM_MAX_ENTRIES)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from app.config import SETTINGS
+from app.log import get_logger
+from app.metrics import STORAGE_LATENCY
+
+log = get_logger("storage")
+
+
+# ---------------------- نوشتن اتمیک ---------------------- #
+
+def _fsync_dir(path: Path):
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    نوشتن در فایل موقت → fsync → rename.
+    اگر وسط نوشتن کرش کند، فایل قبلی سالم می‌ماند.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def atomic_write(path: Path, text: str):
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+# ---------------------- فایل JSON با ذخیره‌ی تجمیعی ---------------------- #
+
+class JsonFile:
+    """
+    یک فایل JSON که کل محتوایش در هر ذخیره بازنویسی می‌شود.
+    - تغییرات علامت dirty می‌خورند و حداکثر هر flush_ms میلی‌ثانیه یک‌بار ذخیره می‌شوند
+    - نوشتن اتمیک است (temp + fsync + rename) و در thread جدا انجام می‌شود
+    - پیش‌فرض JSON فشرده (بدون indent)
+    """
+
+    def __init__(self, path: Path, default: Callable[[], Any], indent: int | None = None,
+                 flush_ms: int | None = None):
+        self.path = path
+        self.default = default
+        self.indent = indent
+        self.delay = (SETTINGS.STORAGE_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+
+        self._snapshot: Callable[[], Any] | None = None
+        self._dirty = False
+        self._task: asyncio.Task | None = None
+        self._lock: asyncio.Lock | None = None
+
+    def load(self):
+        if not self.path.exists():
+            return self.default()
+
+        try:
+            with STORAGE_LATENCY.time("json_load"):
+                return json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            # فایل خراب را کنار بگذار تا ذخیره‌ی بعدی رویش ننویسد
+            broken = self.path.with_name(f"{self.path.name}.corrupt-{int(time.time())}")
+            try:
+                self.path.replace(broken)
+            except OSError:
+                pass
+            log.error("load failed", path=str(self.path), moved_to=broken.name, error=type(e).__name__, detail=str(e))
+            return self.default()
+
+    def _encode(self, data) -> str:
+        if self.indent is None:
+            return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return json.dumps(data, ensure_ascii=False, indent=self.indent)
+
+    def _write(self, text: str) -> bool:
+        try:
+            with STORAGE_LATENCY.time("json_save"):
+                atomic_write(self.path, text)
+            return True
+        except Exception as e:
+            log.error("save failed", path=str(self.path), error=type(e).__name__, detail=str(e))
+            return False
+
+    def save(self, data):
+        self._dirty = not self._write(self._encode(data))
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self._task = None
+
+        # دو نوشتن هم‌زمان روی یک فایل نداشته باشیم
+        async with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+
+            # سریال‌سازی روی همین thread (داده در حین نوشتن تغییر نکند)،
+            # فقط نوشتن روی دیسک به thread دیگر می‌رود
+            text = self._encode(self._snapshot())
+            ok = await asyncio.to_thread(self._write, text)
+
+        if not ok:
+            self.schedule(self._snapshot)
+
+    def schedule(self, snapshot: Callable[[], Any]):
+        self._snapshot = snapshot
+        self._dirty = True
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save(snapshot())
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        if self._task is None:
+            self._task = loop.create_task(self._flush_later())
+
+    def flush(self):
+        """ذخیره‌ی فوری تغییرات باقی‌مانده (برای خاموش‌شدن ربات)."""
+        if self._dirty and self._snapshot is not None:
+            self.save(self._snapshot())
@@ -1,86 +1,180 @@
-import json
-from pathlib import Path
-from datetime import date
+from app.clock import today_iso, days_ago_iso
+from app.config import SETTINGS
+from app.events import CHANGES
+from app.log import get_logger
+from app.metrics import STORAGE_LATENCY
+from app.storage.backend import get_backend, post_key
+from app.storage.copies import forget_copies
 
-# مسیر امن و قابل نوشتن در لیارا
-BASE = Path("storage")
-BASE.mkdir(parents=True, exist_ok=True)
+log = get_logger("posts")
 
-DATA = BASE / "fwd_posts.json"
+
+# ---------------------- ایندکس درون حافظه ---------------------- #
+# فقط روزهای فعال (POSTS_RETENTION_DAYS روز آخر) یک‌بار در استارت خوانده می‌شوند.
+# کلید هر پست (کانال منبع، message_id) است؛ message_id فقط در یک کانال یکتاست.
+# - _POSTS   → (source, message_id) -> post
+# - _BY_DATE → date -> {(source, message_id): post}  (به ترتیب ورود)
+
+_POSTS: dict[tuple[int, int], dict] = {}
+_BY_DATE: dict[str, dict[tuple[int, int], dict]] = {}
+_LOADED = False
 
 
 # ---------------------- ابزارهای داخلی ---------------------- #
 
-def _load():
-    if DATA.exists():
-        try:
-            return json.loads(DATA.read_text(encoding="utf-8"))
-        except:
-            return []
-    return []
+def _index(post: dict):
+    key = post_key(post)
+    _POSTS[key] = post
+    _BY_DATE.setdefault(post["date"], {})[key] = post
+
+
+def _key(message_id: int, source: int | None) -> tuple[int, int]:
+    return source or SETTINGS.SOURCE_CHANNEL_ID, message_id
+
+
+def load_posts():
+    """
+    بارگذاری روزهای فعال از backend و ساخت ایندکس‌ها.
+    در استارت ربات یک‌بار فراخوانی می‌شود.
+    """
+    global _LOADED
+
+    _POSTS.clear()
+    _BY_DATE.clear()
+
+    with STORAGE_LATENCY.time("load_posts"):
+        for p in get_backend().load_posts(since=_cutoff()):
+            _index(p)
+
+    _LOADED = True
+
+
+def _cutoff() -> str:
+    # قدیمی‌ترین روزی که هنوز فعال است
+    return days_ago_iso(SETTINGS.POSTS_RETENTION_DAYS - 1)
+
+
+def _ensure_loaded():
+    if not _LOADED:
+        load_posts()
+
 
+def _persist(post: dict):
+    # فقط همین ردیف ذخیره می‌شود (JSON در پس‌زمینه، SQLite یک UPSERT)
+    get_backend().save_post(post)
 
-def _save(data):
-    try:
-        DATA.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    except:
-        pass
+
+def flush_posts():
+    """
+    ذخیره‌ی فوری (برای خاموش‌شدن ربات).
+    """
+    get_backend().flush()
 
 
 # ---------------------- افزودن پست ---------------------- #
 
-def add_post(message_id: int, msg_date: str, ad_number: int | None):
-    data = _load()
+def add_post(message_id: int, msg_date: str, ad_number: int | None,
+             message_ids: list[int] | None = None, source: int | None = None):
+    """
+    message_ids → برای آلبوم: همه‌ی پیام‌های گروه (message_id اولین آن‌هاست).
+    source → کانال منبع (پیش‌فرض: SOURCE_CHANNEL_ID)
+    """
+    _ensure_loaded()
+
+    key = _key(message_id, source)
 
     # جلوگیری از تکرار
-    for p in data:
-        if p["message_id"] == message_id:
-            return
+    if key in _POSTS:
+        return
 
-    data.append({
+    post = {
+        "source": key[0],
         "message_id": message_id,
         "ad_number": ad_number,
         "date": msg_date,
         "active": True,
         "sent_once": False
-    })
+    }
+    if message_ids and len(message_ids) > 1:
+        post["message_ids"] = sorted(message_ids)
+    _index(post)
 
-    _save(data)
+    _persist(post)
+    CHANGES.publish("posts")
 
 
 # ---------------------- لیست پست‌های امروز ---------------------- #
 
-def list_today_posts():
-    today = date.today().isoformat()
-    return [p for p in _load() if p["date"] == today]
+def list_today_posts(source: int | None = None):
+    """پست‌های امروز (همه‌ی منبع‌ها یا فقط source)."""
+    _ensure_loaded()
+    posts = _BY_DATE.get(today_iso(), {}).values()
+    if source is None:
+        return list(posts)
+    return [p for p in posts if p["source"] == source]
 
 
 # ---------------------- فعال / غیرفعال کردن ---------------------- #
 
-def toggle_post(message_id: int):
-    data = _load()
-    for p in data:
-        if p["message_id"] == message_id:
-            p["active"] = not p.get("active", True)
-            _save(data)
-            return p["active"]
-    return None
+def toggle_post(message_id: int, source: int | None = None):
+    _ensure_loaded()
+    p = _POSTS.get(_key(message_id, source))
+    if p is None:
+        return None
+
+    p["active"] = not p.get("active", True)
+    _persist(p)
+    CHANGES.publish("posts")
+    return p["active"]
 
 
 # ---------------------- ارسال یکبار ---------------------- #
 
-def mark_sent_once(message_id: int):
-    data = _load()
-    for p in data:
-        if p["message_id"] == message_id:
-            p["sent_once"] = True
-            _save(data)
-            return True
-    return False
-
-
-def is_sent_once(message_id: int) -> bool:
-    for p in _load():
-        if p["message_id"] == message_id:
-            return p.get("sent_once", False)
-    return False
+def mark_sent_once(message_id: int, source: int | None = None):
+    _ensure_loaded()
+    p = _POSTS.get(_key(message_id, source))
+    if p is None:
+        return False
+
+    p["sent_once"] = True
+    _persist(p)
+    return True
+
+
+def is_sent_once(message_id: int, source: int | None = None) -> bool:
+    _ensure_loaded()
+    p = _POSTS.get(_key(message_id, source))
+    if p is None:
+        return False
+    return p.get("sent_once", False)
+
+
+# ---------------------- جابه‌جایی روزانه ---------------------- #
+
+def rollover() -> list[str]:
+    """
+    روزهای قدیمی‌تر از POSTS_RETENTION_DAYS را از حافظه خارج
+    و طبق POSTS_ARCHIVE بایگانی (gzip) یا حذف می‌کند.
+    در استارت و هر نیمه‌شب (به وقت TIMEZONE) اجرا می‌شود.
+    """
+    _ensure_loaded()
+
+    cutoff = _cutoff()
+    backend = get_backend()
+    old_days = [d for d in backend.list_post_days() if d < cutoff]
+
+    for day in old_days:
+        evicted = []
+        for key, p in _BY_DATE.pop(day, {}).items():
+            _POSTS.pop(key, None)
+            evicted.extend((key[0], mid) for mid in p.get("message_ids") or [key[1]])
+        backend.archive_post_day(day, SETTINGS.POSTS_ARCHIVE)
+
+        # پست‌های بایگانی‌شده دیگر ویرایش نمی‌شوند
+        forget_copies(evicted)
+
+    if old_days:
+        log.info("rollover", days=len(old_days), archive=SETTINGS.POSTS_ARCHIVE)
+
+    CHANGES.publish("posts")
+    return old_days
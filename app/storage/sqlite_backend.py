@@ -0,0 +1,329 @@
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Any
+
+from app.config import SETTINGS
+from app.log import get_logger
+from app.metrics import STORAGE_LATENCY
+from app.storage.backend import StorageBackend, JsonBackend, post_key
+
+log = get_logger("storage")
+
+
+# جدول‌هایی که کلیدشان (source, message_id) است
+POSTS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    source     INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    date       TEXT    NOT NULL,
+    data       TEXT    NOT NULL,
+    PRIMARY KEY (source, message_id)
+)"""
+
+COPIES_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    source     INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    chat_id    INTEGER NOT NULL,
+    copy_id    INTEGER NOT NULL,
+    PRIMARY KEY (source, message_id, chat_id, copy_id)
+)"""
+
+SCHEMA = POSTS_TABLE.format(name="posts") + """;
+CREATE INDEX IF NOT EXISTS idx_posts_date ON posts(date);
+
+CREATE TABLE IF NOT EXISTS posts_archive (
+    date TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dests (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL UNIQUE,
+    data    TEXT    NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS admins (
+    uid INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id     TEXT PRIMARY KEY,
+    due_at REAL NOT NULL,
+    data   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(due_at);
+
+CREATE TABLE IF NOT EXISTS outbox_done (
+    id      TEXT PRIMARY KEY,
+    done_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_done_at ON outbox_done(done_at);
+
+""" + COPIES_TABLE.format(name="copies") + """;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _dump(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------------------- پیاده‌سازی SQLite ---------------------- #
+
+class SqliteBackend(StorageBackend):
+    """
+    ذخیره‌سازی در یک فایل SQLite (حالت WAL).
+    هر تغییر فقط یک ردیف را می‌نویسد، نه کل تاریخچه را.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+        # مهاجرت یک‌باره از فایل‌های JSON قدیمی
+        if self._meta("json_imported") is None:
+            import_json(self, JsonBackend())
+
+    # ---- ابزارهای داخلی ---- #
+    def _exec(self, sql: str, params=()):
+        with self._lock, STORAGE_LATENCY.time("sqlite_write"):
+            return self._db.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock, STORAGE_LATENCY.time("sqlite_read"):
+            return self._db.execute(sql, params).fetchall()
+
+    def _meta(self, key: str) -> str | None:
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def _set_meta(self, key: str, value: str):
+        self._exec("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+    # ---- پست‌ها (بخش فعال بر اساس date، روزهای قدیمی در posts_archive) ---- #
+    def load_posts(self, since: str | None = None) -> list[dict]:
+        if since is None:
+            rows = self._query("SELECT data FROM posts ORDER BY message_id")
+        else:
+            rows = self._query("SELECT data FROM posts WHERE date >= ? ORDER BY message_id", (since,))
+        return [json.loads(r[0]) for r in rows]
+
+    def list_post_days(self) -> list[str]:
+        return [r[0] for r in self._query("SELECT DISTINCT date FROM posts ORDER BY date")]
+
+    def archive_post_day(self, day: str, mode: str = "gzip"):
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM posts WHERE date = ?", (day,)).fetchall()
+
+            self._db.execute("BEGIN")
+            try:
+                if mode == "gzip" and rows:
+                    blob = zlib.compress(("[" + ",".join(r[0] for r in rows) + "]").encode("utf-8"))
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO posts_archive(date, data) VALUES (?, ?)",
+                        (day, blob)
+                    )
+                self._db.execute("DELETE FROM posts WHERE date = ?", (day,))
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def save_post(self, post: dict):
+        self._exec(
+            "INSERT OR REPLACE INTO posts(source, message_id, date, data) VALUES (?, ?, ?, ?)",
+            (*post_key(post), post["date"], _dump(post))
+        )
+
+    # ---- مقصدها ---- #
+    def load_dests(self) -> list[dict]:
+        rows = self._query("SELECT data FROM dests ORDER BY id")
+        return [json.loads(r[0]) for r in rows]
+
+    def get_dest(self, chat_id: int) -> dict | None:
+        rows = self._query("SELECT data FROM dests WHERE chat_id = ?", (chat_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def save_dest(self, dest: dict):
+        self._exec(
+            "INSERT INTO dests(chat_id, data) VALUES (?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data",
+            (dest["chat_id"], _dump(dest))
+        )
+
+    def delete_dest(self, chat_id: int) -> bool:
+        return self._exec("DELETE FROM dests WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+    # ---- ادمین‌ها ---- #
+    def load_admins(self) -> set[int]:
+        return {r[0] for r in self._query("SELECT uid FROM admins")}
+
+    def save_admin(self, uid: int):
+        self._exec("INSERT OR IGNORE INTO admins(uid) VALUES (?)", (int(uid),))
+
+    def delete_admin(self, uid: int):
+        self._exec("DELETE FROM admins WHERE uid = ?", (int(uid),))
+
+    # ---- تنظیمات ---- #
+    def load_settings(self) -> dict:
+        return {k: json.loads(v) for k, v in self._query("SELECT key, value FROM settings")}
+
+    def save_setting(self, key: str, value: Any):
+        self._exec(
+            "INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)",
+            (key, _dump(value))
+        )
+
+    # ---- صف ارسال (outbox) ---- #
+    def load_jobs(self) -> list[dict]:
+        rows = self._query("SELECT data FROM outbox ORDER BY due_at")
+        return [json.loads(r[0]) for r in rows]
+
+    def save_job(self, job: dict):
+        self._exec(
+            "INSERT OR REPLACE INTO outbox(id, due_at, data) VALUES (?, ?, ?)",
+            (job["id"], job["due_at"], _dump(job))
+        )
+
+    def complete_job(self, job_id: str, done_at: float):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("DELETE FROM outbox WHERE id = ?", (job_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO outbox_done(id, done_at) VALUES (?, ?)",
+                    (job_id, done_at)
+                )
+            except:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def delete_jobs(self, job_ids: list[str]):
+        with self._lock, STORAGE_LATENCY.time("sqlite_write"):
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(k,) for k in job_ids])
+
+    def delete_chat_jobs(self, chat_id: int) -> int:
+        cur = self._exec("DELETE FROM outbox WHERE json_extract(data, '$.chat_id') = ?", (chat_id,))
+        return cur.rowcount
+
+    def load_done(self) -> dict[str, float]:
+        return dict(self._query("SELECT id, done_at FROM outbox_done"))
+
+    def prune_done(self, before: float):
+        self._exec("DELETE FROM outbox_done WHERE done_at < ?", (before,))
+
+    def delete_done(self, job_ids: list[str]):
+        with self._lock, STORAGE_LATENCY.time("sqlite_write"):
+            self._db.executemany("DELETE FROM outbox_done WHERE id = ?", [(k,) for k in job_ids])
+
+    # ---- نقشه‌ی کپی‌ها ---- #
+    def save_copies(self, chat_id: int, source: int, copies: dict[int, int]):
+        with self._lock, STORAGE_LATENCY.time("sqlite_write"):
+            self._db.executemany(
+                "INSERT OR IGNORE INTO copies(source, message_id, chat_id, copy_id) VALUES (?, ?, ?, ?)",
+                [(source, mid, chat_id, cid) for mid, cid in copies.items()]
+            )
+
+    def load_copies(self, source: int, message_id: int) -> dict[int, list[int]]:
+        copies: dict[int, list[int]] = {}
+        for chat_id, copy_id in self._query(
+            "SELECT chat_id, copy_id FROM copies WHERE source = ? AND message_id = ? ORDER BY chat_id, copy_id",
+            (source, message_id)
+        ):
+            copies.setdefault(chat_id, []).append(copy_id)
+        return copies
+
+    def delete_copies(self, keys: list[tuple[int, int]]):
+        with self._lock, STORAGE_LATENCY.time("sqlite_write"):
+            self._db.executemany(
+                "DELETE FROM copies WHERE source = ? AND message_id = ?",
+                [tuple(k) for k in keys]
+            )
+
+    # ---- عمومی ---- #
+    def flush(self):
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+
+# ---------------------- مهاجرت از JSON ---------------------- #
+
+def import_json(db: SqliteBackend, src: JsonBackend):
+    """
+    انتقال یک‌باره‌ی داده‌های فایل‌های JSON به SQLite.
+    بعد از اجرا در جدول meta علامت‌گذاری می‌شود تا دوباره اجرا نشود.
+    """
+    posts = src.load_posts()
+    dests = src.load_dests()
+    admins = src.load_admins()
+    settings = src.load_settings()
+
+    with db._lock:
+        db._db.execute("BEGIN")
+        try:
+            db._db.executemany(
+                "INSERT OR REPLACE INTO posts(source, message_id, date, data) VALUES (?, ?, ?, ?)",
+                [(*post_key(p), p["date"], _dump(p)) for p in posts]
+            )
+            db._db.executemany(
+                "INSERT OR IGNORE INTO dests(chat_id, data) VALUES (?, ?)",
+                [(d["chat_id"], _dump(d)) for d in dests]
+            )
+            db._db.executemany(
+                "INSERT OR IGNORE INTO admins(uid) VALUES (?)",
+                [(uid,) for uid in admins]
+            )
+            db._db.executemany(
+                "INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)",
+                [(k, _dump(v)) for k, v in settings.items()]
+            )
+            db._db.execute(
+                "INSERT OR REPLACE INTO meta(key, value) VALUES ('json_imported', '1')"
+            )
+            db._db.execute("COMMIT")
+        except:
+            db._db.execute("ROLLBACK")
+            raise
+
+    log.info(
+        "imported json into sqlite", posts=len(posts), dests=len(dests),
+        admins=len(admins), settings=len(settings)
+    )
+
+
+if __name__ == "__main__":
+    # اجرای دستی مهاجرت:
+    #   python -m app.storage.sqlite_backend [--force]
+    # INSERT OR REPLACE داده‌های جدیدتر SQLite را بازنویسی می‌کند،
+    # پس بعد از import اول فقط با --force دوباره اجرا می‌شود.
+    import sys
+
+    path = Path(SETTINGS.SQLITE_PATH)
+    existed = path.exists()
+    backend = SqliteBackend(path)   # فایل تازه → import همین‌جا در سازنده انجام می‌شود
+
+    if existed and backend._meta("json_imported") is not None:
+        if "--force" not in sys.argv[1:]:
+            sys.exit("json already imported into sqlite; rerun with --force to overwrite")
+        import_json(backend, JsonBackend())
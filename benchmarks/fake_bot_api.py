@@ -0,0 +1,119 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+# ---------------------- سرور جعلی Bot API ---------------------- #
+
+class FakeBotAPI:
+    """
+    جایگزین محلی api.telegram.org برای بنچمارک.
+    - latency / jitter → تأخیر هر پاسخ (ثانیه)
+    - rate_429         → احتمال پاسخ 429 با retry_after
+    - error_rate       → احتمال خطای 400 (chat not found)
+    """
+
+    def __init__(self, latency: float = 0.03, jitter: float = 0.01, rate_429: float = 0.0,
+                 retry_after: int = 1, error_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+
+        self.calls: Counter = Counter()
+        self.responses: Counter = Counter()
+        self.messages = 0
+
+        self._rand = random.Random(seed)
+        self._next_id = 1_000_000
+        self._runner: web.AppRunner | None = None
+
+    # ---- پاسخ‌ها ---- #
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _message(self, chat_id) -> dict:
+        return {
+            "message_id": self._new_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "supergroup", "title": "bench"},
+        }
+
+    def _result(self, method: str, data: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+        if method == "getChat":
+            return {"id": int(data.get("chat_id", 0)), "type": "supergroup", "title": "bench"}
+
+        if method == "copyMessage":
+            self.messages += 1
+            return {"message_id": self._new_id()}
+
+        if method == "copyMessages":
+            ids = json.loads(data.get("message_ids", "[]"))
+            self.messages += len(ids)
+            return [{"message_id": self._new_id()} for _ in ids]
+
+        if method.startswith("send") or method.startswith("edit"):
+            self.messages += 1
+            return self._message(data.get("chat_id"))
+
+        return True
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+
+        data = dict(await request.post())
+
+        delay = self.latency + self._rand.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self._rand.random()
+
+        if roll < self.rate_429:
+            self.responses["429"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        if roll < self.rate_429 + self.error_rate:
+            self.responses["400"] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 400,
+                "description": "Bad Request: chat not found",
+            })
+
+        self.responses["200"] += 1
+        return web.json_response({"ok": True, "result": self._result(method, data)})
+
+    # ---- شروع / توقف ---- #
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """اجرای سرور و برگرداندن آدرس پایه (مثلاً http://127.0.0.1:43210)."""
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
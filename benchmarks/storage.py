@@ -0,0 +1,215 @@
+"""
+میکروبنچمارک لایه‌ی ذخیره‌سازی (posts / dests / admins / settings).
+
+    python -m benchmarks.storage --sizes 10000 100000 1000000 --dests 5000
+    python -m benchmarks.storage --save-baseline      # ذخیره در baseline_storage.json
+    python -m benchmarks.storage --backends sqlite    # مقایسه با baseline موجود
+
+هر (backend، اندازه) در یک پروسه‌ی جدا اجرا می‌شود تا حافظه‌ی اوج (ru_maxrss) دقیق باشد.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline_storage.json"
+
+# هر عملیات حداکثر این‌قدر (ثانیه) یا --repeat بار اجرا می‌شود
+OP_BUDGET = 2.0
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--dests", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--backends", nargs="+", choices=("json", "sqlite"), default=["json", "sqlite"])
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--case", help=argparse.SUPPRESS)   # اجرای داخلی: backend:size
+    return ap.parse_args(argv)
+
+
+# ---------------------- ساخت داده ---------------------- #
+
+def _fill(workdir: Path, size: int, dests: int):
+    """
+    نوشتن مستقیم فایل‌های JSON (سریع‌تر از add_post تک‌تک).
+    backend SQLite همین فایل‌ها را در اولین اجرا import می‌کند.
+    همه‌ی پست‌ها داخل پنجره‌ی POSTS_RETENTION_DAYS (به وقت ربات) پخش می‌شوند
+    تا toggle_post / is_sent_once پست موجود را اندازه بگیرند، نه پست بایگانی‌شده را.
+    """
+    from app.clock import today
+    from app.config import SETTINGS
+
+    storage = workdir / "storage"
+    storage.mkdir(parents=True, exist_ok=True)
+
+    days = SETTINGS.POSTS_RETENTION_DAYS
+    first = today()
+    posts = []
+    for i in range(size):
+        day = first - timedelta(days=(size - 1 - i) * days // size)
+        posts.append({
+            "message_id": i + 1,
+            "ad_number": i + 1,
+            "date": day.isoformat(),
+            "active": True,
+            "sent_once": False,
+        })
+
+    (storage / "fwd_posts.json").write_text(json.dumps(posts), encoding="utf-8")
+    (storage / "fwd_dests.json").write_text(
+        json.dumps([{"chat_id": -1001000000000 - j, "title": f"g{j}"} for j in range(dests)]),
+        encoding="utf-8"
+    )
+
+
+def _time_op(fn, repeat: int) -> dict:
+    samples = []
+    deadline = time.perf_counter() + OP_BUDGET
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+        if time.perf_counter() > deadline:
+            break
+
+    samples.sort()
+    return {
+        "n": len(samples),
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+
+# ---------------------- اجرای یک حالت (پروسه‌ی جدا) ---------------------- #
+
+def run_case(backend: str, size: int, args) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="fwdstore-"))
+
+    os.chdir(workdir)
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCHMARK",
+        "STORAGE_BACKEND": backend,
+        "SQLITE_PATH": str(workdir / "bench.db"),
+    })
+    sys.path.insert(0, str(ROOT))
+
+    _fill(workdir, size, args.dests)
+
+    from app.clock import today_iso
+    from app.storage import posts, dests, admins
+    from app.storage.backend import get_backend
+    import settings_storage
+
+    result = {"backend": backend, "posts": size, "dests": args.dests}
+
+    start = time.perf_counter()
+    get_backend()                       # شامل import یک‌باره در SQLite
+    result["open_s"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    posts.load_posts()
+    result["load_posts_s"] = round(time.perf_counter() - start, 3)
+
+    rnd = random.Random(1)
+    today = today_iso()
+    new_dest = -1002000000000
+
+    ops = {
+        "add_post": lambda i: posts.add_post(size + 1 + i, today, i),
+        "list_today_posts": lambda i: posts.list_today_posts(),
+        "toggle_post": lambda i: posts.toggle_post(rnd.randint(1, size)),
+        "is_sent_once": lambda i: posts.is_sent_once(rnd.randint(1, size)),
+        "add_destination": lambda i: dests.add_destination(new_dest - i, "bench"),
+        "list_destinations": lambda i: dests.list_destinations(),
+        "remove_destination": lambda i: dests.remove_destination(new_dest - i),
+        "is_admin": lambda i: admins.is_admin(rnd.randint(1, 1000)),
+        "get_interval": lambda i: settings_storage.get_interval(),
+    }
+
+    result["ops"] = {name: _time_op(fn, args.repeat) for name, fn in ops.items()}
+
+    start = time.perf_counter()
+    get_backend().flush()
+    result["flush_s"] = round(time.perf_counter() - start, 3)
+
+    # Linux: کیلوبایت
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+# ---------------------- اجرای کامل ---------------------- #
+
+def _compare(results: list[dict]):
+    if not BASELINE.exists():
+        return
+
+    base = {(r["backend"], r["posts"]): r for r in json.loads(BASELINE.read_text(encoding="utf-8"))["results"]}
+
+    print("\n# compared to baseline (x = current / baseline mean)")
+    for r in results:
+        b = base.get((r["backend"], r["posts"]))
+        if b is None:
+            continue
+        parts = []
+        for op, stats in r["ops"].items():
+            old = b["ops"].get(op)
+            if old and old["mean_us"]:
+                parts.append(f"{op}={stats['mean_us'] / old['mean_us']:.2f}x")
+        print(f"{r['backend']:>6} {r['posts']:>8}: " + " ".join(parts))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.case:
+        backend, size = args.case.split(":")
+        print(json.dumps(run_case(backend, int(size), args)))
+        return
+
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            cmd = [
+                sys.executable, "-m", "benchmarks.storage",
+                "--case", f"{backend}:{size}",
+                "--dests", str(args.dests),
+                "--repeat", str(args.repeat),
+            ]
+            out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            results.append(r)
+
+            print(
+                f"{backend:>6} {size:>8} posts | load {r['load_posts_s']}s | "
+                + " ".join(f"{op}={s['mean_us']}us" for op, s in r["ops"].items())
+                + f" | peak {r['peak_rss_mb']}MB"
+            )
+
+    _compare(results)
+
+    if args.save_baseline:
+        BASELINE.write_text(
+            json.dumps({"created": date.today().isoformat(), "results": results}, indent=2),
+            encoding="utf-8"
+        )
+        print(f"\nbaseline saved → {BASELINE}")
+
+
+if __name__ == "__main__":
+    main()
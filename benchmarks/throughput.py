@@ -0,0 +1,222 @@
+"""
+بنچمارک توان ارسال ربات در برابر سرور جعلی Bot API.
+
+    python -m benchmarks.throughput --scenario scheduler --posts 1000 --dests 500
+    python -m benchmarks.throughput --scenario once --posts 200 --dests 200 --rate-429 0.01
+
+خروجی: تعداد ارسال در ثانیه، p50/p99 تأخیر API و تعداد فراخوانی API به ازای هر ارسال.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fake_bot_api import FakeBotAPI  # noqa: E402
+
+SOURCE_ID = -1000000000001
+DEST_BASE = -1001000000000
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenario", choices=("scheduler", "once"), default="scheduler")
+    ap.add_argument("--posts", type=int, default=200)
+    ap.add_argument("--dests", type=int, default=100)
+    ap.add_argument("--latency-ms", type=float, default=30)
+    ap.add_argument("--jitter-ms", type=float, default=10)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--global-rate", type=float, default=1e6, help="پیش‌فرض: بدون محدودیت")
+    ap.add_argument("--chat-rate-per-min", type=float, default=1e6, help="پیش‌فرض: بدون محدودیت")
+    ap.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    ap.add_argument("--no-batch", action="store_true", help="بدون copyMessages")
+    ap.add_argument("--senders", type=int, default=0, help="تعداد ربات ارسال اضافه (SENDER_TOKENS)")
+    ap.add_argument("--timeout", type=float, default=600)
+    ap.add_argument("--json", dest="json_out", help="ذخیره‌ی گزارش در این فایل")
+    ap.add_argument("--verbose", action="store_true", help="چاپ لاگ‌های ربات")
+    return ap.parse_args(argv)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _prepare_env(args):
+    """
+    محیط جدا برای هر اجرا: پوشه‌ی storage موقت و تنظیمات از طریق env
+    (باید قبل از import ماژول‌های app انجام شود).
+    """
+    workdir = tempfile.mkdtemp(prefix="fwdbench-")
+    os.chdir(workdir)
+
+    os.environ.update({
+        "BOT_TOKEN": "123456:BENCHMARK",
+        "OWNER_ID": "1",
+        "SOURCE_CHANNEL_ID": str(SOURCE_ID),
+        "SEND_CONCURRENCY": str(args.concurrency),
+        "GLOBAL_RATE": str(args.global_rate),
+        "CHAT_RATE_PER_MIN": str(args.chat_rate_per_min),
+        "STORAGE_BACKEND": args.backend,
+        "SQLITE_PATH": str(Path(workdir) / "bench.db"),
+    })
+    return workdir
+
+
+async def _wait_done(expected: int, timeout: float):
+    from app.metrics import DELIVERIES
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        done = sum(v for k, v in DELIVERIES._values.items() if k != ("retry",))
+        if done >= expected:
+            return done
+        await asyncio.sleep(0.05)
+    return sum(v for k, v in DELIVERIES._values.items() if k != ("retry",))
+
+
+async def run(args) -> dict:
+    workdir = _prepare_env(args)
+
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    fake = FakeBotAPI(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        seed=42,
+    )
+    base = await fake.start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base))
+    bot = Bot(token="123456:BENCHMARK", session=session)
+
+    # زمان سمت کلاینت برای هر فراخوانی API
+    latencies: list[float] = []
+
+    @session.middleware
+    async def _timing(make_request, bot_, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot_, method)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    from app.botpool import POOL
+    from app.outbox import OUTBOX
+    from app.storage.posts import add_post
+    from app.storage.dests import add_destination
+    from app.handlers.scheduler import start_scheduler, forward_post, forward_posts
+    import settings_storage
+
+    for j in range(args.dests):
+        add_destination(DEST_BASE - j, f"bench {j}")
+
+    expected = args.posts * args.dests
+    POOL.start(bot, [f"{900000 + i}:SENDER" for i in range(args.senders)])
+    OUTBOX.start(bot, forward_post, None if args.no_batch else forward_posts, pool=POOL)
+
+    tasks = []
+    started = time.perf_counter()
+
+    if args.scenario == "scheduler":
+        today = date.today().isoformat()
+        for i in range(args.posts):
+            add_post(message_id=i + 1, msg_date=today, ad_number=i + 1)
+
+        settings_storage.set_interval_value(10 ** 6)
+        settings_storage.set_send_mode("repeat")
+
+        started = time.perf_counter()
+        tasks.append(asyncio.create_task(start_scheduler(bot)))
+
+    else:
+        settings_storage.set_send_mode("once")
+
+        source = importlib.import_module("app.handlers.source")
+        dp = Dispatcher()
+        dp.include_router(source.router)
+
+        started = time.perf_counter()
+        for i in range(args.posts):
+            update = types.Update(
+                update_id=i + 1,
+                channel_post=types.Message(
+                    message_id=i + 1,
+                    date=int(time.time()),
+                    chat=types.Chat(id=SOURCE_ID, type="channel"),
+                    text=f"🔖 آگهی شماره #{i + 1}",
+                ),
+            )
+            await dp.feed_update(bot, update)
+
+    done = await _wait_done(expected, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    for t in tasks:
+        t.cancel()
+    await OUTBOX.stop()
+    await POOL.close()
+    await bot.session.close()
+    await fake.stop()
+
+    calls = sum(fake.calls.values())
+    send_calls = fake.calls["copyMessage"] + fake.calls["copyMessages"]
+
+    return {
+        "scenario": args.scenario,
+        "backend": args.backend,
+        "batch": not args.no_batch,
+        "senders": args.senders + 1,
+        "posts": args.posts,
+        "dests": args.dests,
+        "expected_deliveries": expected,
+        "finished_deliveries": done,
+        "elapsed_s": round(elapsed, 3),
+        "deliveries_per_s": round(done / elapsed, 1) if elapsed else 0,
+        "api_calls": dict(fake.calls),
+        "api_calls_per_delivery": round(send_calls / done, 4) if done else None,
+        "api_responses": dict(fake.responses),
+        "api_latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "api_latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "total_api_calls": calls,
+        "workdir": workdir,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.verbose:
+        report = asyncio.run(run(args))
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = asyncio.run(run(args))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+
+    if args.json_out:
+        Path(args.json_out).write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import asyncio
 import os
+import signal
 from aiohttp import web
 
 from aiogram import Router, types
 from aiogram.filters import CommandStart
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from app.config import build_bot_and_dispatcher, SETTINGS
 from app.handlers.source import router as source_router
@@ -12,13 +14,116 @@ from app.handlers.admin_panel import (
     admin_keyboard,
     is_admin,
 )
-from app.handlers.scheduler import start_scheduler
+from app.handlers.scheduler import start_scheduler, start_rollover, forward_post, forward_posts
+from app.botpool import POOL
+from app.cluster import CLUSTER
+from app.log import get_logger, setup_logging, stop_logging
+from app.outbox import OUTBOX
+from app.metrics import render as render_metrics, scheduler_health
+from app.middlewares import ApiMetricsMiddleware, UpdateMetricsMiddleware, HandlerMetricsMiddleware
+from app.storage.admins import bootstrap_admins, reload_admins
+from app.storage.aio import close as close_storage
+from app.storage.dests import reload_routes
+from app.storage.posts import load_posts, flush_posts
+from settings_storage import reload_settings
+
+log = get_logger("main")
+
+
+class LeaderRequestHandler(SimpleRequestHandler):
+    """
+    حالت خوشه: فقط leader آپدیت webhook را می‌پذیرد؛
+    بقیه 503 می‌دهند تا تلگرام همان آپدیت را دوباره بفرستد.
+    """
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not CLUSTER.is_leader:
+            return web.Response(status=503)
+        return await super().handle(request)
+
+
+def stop_on_signals() -> asyncio.Event:
+    """
+    SIGTERM/SIGINT فقط این event را set می‌کنند (به‌جای کشتن پروسه)
+    تا finally در main (تخلیه‌ی outbox، ترک خوشه، flush) اجرا شود.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # ویندوز
+            pass
+    return stop
+
+
+async def poll_as_leader(dp, bot, stop: asyncio.Event):
+    """
+    حالت خوشه: فقط worker که lease leader را دارد long-poll می‌کند
+    (دو getUpdates هم‌زمان با یک توکن ممکن نیست).
+    با از دست رفتن leader، polling متوقف و منتظر نوبت بعدی می‌ماند؛
+    با set شدن stop (سیگنال) در هر دو حالت برمی‌گردد.
+    """
+    stopping = asyncio.create_task(stop.wait())
+    try:
+        while True:
+            leader = asyncio.create_task(CLUSTER.wait_leader())
+            await asyncio.wait({leader, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if stopping.done():
+                leader.cancel()
+                return
+            log.info("leader, starting polling")
+
+            # سیگنال‌ها با stop مدیریت می‌شوند، نه با handlerهای aiogram
+            polling = asyncio.create_task(dp.start_polling(bot, close_bot_session=False, handle_signals=False))
+            demoted = asyncio.create_task(CLUSTER.wait_leader(False))
+
+            done, _ = await asyncio.wait({polling, demoted, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if polling in done:
+                demoted.cancel()
+                return polling.result()
+
+            demoted.cancel()
+            log.info("stopping polling", reason="signal" if stopping.done() else "lost leadership")
+            try:
+                await dp.stop_polling()
+            except RuntimeError:
+                # polling هنوز شروع نشده بود
+                polling.cancel()
+            await asyncio.gather(polling, return_exceptions=True)
+
+            if stopping.done():
+                return
+    finally:
+        stopping.cancel()
 
 
 async def main():
+    # ---- لاگ JSON از طریق صف (قبل از هر چیز) ---- #
+    setup_logging()
+
     # ---- ساخت Bot و Dispatcher ---- #
     bot, dp, _settings = build_bot_and_dispatcher()
 
+    # ---- بارگذاری آرشیو پست‌ها و ادمین‌ها در حافظه ---- #
+    load_posts()
+    bootstrap_admins(SETTINGS.OWNER_ID, SETTINGS.ADMIN_IDS)
+
+    # ---- حالت خوشه: ثبت این worker و گرفتن سهم shardها (قبل از outbox) ---- #
+    if SETTINGS.CLUSTER_MODE:
+        CLUSTER.start()
+
+    # ---- ربات‌های ارسال (ربات اصلی + SENDER_TOKENS) ---- #
+    POOL.start(bot)
+
+    # ---- متریک‌ها ---- #
+    for sender in POOL.bots:
+        sender.session.middleware(ApiMetricsMiddleware())
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for observer in (dp.message, dp.channel_post, dp.edited_channel_post, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+
     # ---- هندلر /start ---- #
     start_router = Router()
 
@@ -37,31 +142,86 @@ async def main():
     dp.include_router(source_router)
     dp.include_router(admin_router)
 
+    # ---- صف ارسال (outbox) ---- #
+    OUTBOX.start(bot, forward_post, forward_posts, pool=POOL)
+
+    # ---- heartbeat خوشه و هم‌گام‌سازی کش‌ها با بقیه‌ی workerها ---- #
+    if SETTINGS.CLUSTER_MODE:
+        asyncio.create_task(CLUSTER.run({
+            "posts": load_posts,
+            "dests": reload_routes,
+            "settings": reload_settings,
+            "admins": reload_admins,
+        }, OUTBOX.sync))
+
     # ---- Scheduler در پس‌زمینه ---- #
+    asyncio.create_task(start_rollover())
     asyncio.create_task(start_scheduler(bot))
-    print("[MAIN] Scheduler started in background.")
+    log.info("scheduler started in background")
 
     # ---- وب‌سرور healthcheck ---- #
     async def healthcheck(_):
         return web.Response(text="Bot is running!")
 
+    async def metrics(_):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    async def healthz(_):
+        ok, info = scheduler_health()
+        return web.json_response(info, status=200 if ok else 503)
+
     app = web.Application()
     app.router.add_get("/", healthcheck)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/healthz", healthz)
+
+    # ---- Webhook روی همان اپلیکیشن ---- #
+    if SETTINGS.UPDATE_MODE == "webhook":
+        handler = LeaderRequestHandler if SETTINGS.CLUSTER_MODE else SimpleRequestHandler
+        handler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=SETTINGS.WEBHOOK_SECRET,
+        ).register(app, path=SETTINGS.WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
 
     port = int(os.environ.get("PORT", "8080"))
     runner = web.AppRunner(app)
     await runner.setup()
     await web.TCPSite(runner, "0.0.0.0", port).start()
 
-    print(f"[MAIN] HTTP healthcheck server running on port {port}")
+    log.info("http server running", port=port)
 
-    # ---- استارت Polling ---- #
+    # ---- استارت دریافت آپدیت‌ها (Webhook یا Polling) ---- #
+    # در polling تک‌worker، start_polling خودش handlerهای سیگنال را جایگزین می‌کند
+    stop = stop_on_signals()
     try:
-        print("[MAIN] Starting bot polling...")
-        await dp.start_polling(bot)
+        if SETTINGS.UPDATE_MODE == "webhook":
+            await bot.set_webhook(
+                url=SETTINGS.WEBHOOK_URL + SETTINGS.WEBHOOK_PATH,
+                secret_token=SETTINGS.WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            log.info("webhook set", url=SETTINGS.WEBHOOK_URL + SETTINGS.WEBHOOK_PATH)
+            await stop.wait()
+            log.info("stop signal received")
+        else:
+            log.info("starting polling")
+            await bot.delete_webhook()
+            if SETTINGS.CLUSTER_MODE:
+                await poll_as_leader(dp, bot, stop)
+            else:
+                await dp.start_polling(bot)
     except Exception as e:
-        print(f"[MAIN] Polling crashed: {e}")
-
+        log.exception("update loop crashed", mode=SETTINGS.UPDATE_MODE, error=type(e).__name__)
+    finally:
+        await OUTBOX.stop()
+        CLUSTER.leave()
+        await POOL.close()
+        await runner.cleanup()
+        close_storage()
+        flush_posts()
+        stop_logging()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,30 +1,40 @@
-import json
-from pathlib import Path
+from app.events import CHANGES
+from app.storage.backend import get_backend
 
-# محل ذخیره‌سازی تنظیمات
-SETTINGS_FILE = Path("storage/fwd_settings.json")
+# مقادیر پیش‌فرض تنظیمات
+DEFAULTS = {
+    "send_mode": "repeat",
+    "interval": 1800  # 30 دقیقه
+}
+
+# تنظیمات فقط یک‌بار خوانده می‌شوند و در حافظه می‌مانند (write-through)
+_CACHE: dict | None = None
 
 
 def _load():
-    if SETTINGS_FILE.exists():
-        try:
-            return json.loads(SETTINGS_FILE.read_text(encoding="utf-8"))
-        except:
-            pass
+    global _CACHE
+
+    if _CACHE is None:
+        data = get_backend().load_settings()
+        if not data:
+            for key, value in DEFAULTS.items():
+                get_backend().save_setting(key, value)
+            data = dict(DEFAULTS)
+        _CACHE = data
+
+    return _CACHE
+
 
-    default = {
-        "send_mode": "repeat",
-        "interval": 1800  # 30 دقیقه
-    }
-    _save(default)
-    return default
+def reload_settings():
+    """خواندن دوباره از backend (تغییر تنظیمات در پروسه‌ی دیگر)."""
+    global _CACHE
+    _CACHE = None
 
 
-def _save(data):
-    SETTINGS_FILE.write_text(
-        json.dumps(data, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+def _save(key: str, value):
+    _load()[key] = value
+    get_backend().save_setting(key, value)
+    CHANGES.publish("settings")
 
 
 def get_send_mode():
@@ -32,9 +42,7 @@ def get_send_mode():
 
 
 def set_send_mode(mode: str):
-    data = _load()
-    data["send_mode"] = mode
-    _save(data)
+    _save("send_mode", mode)
 
 
 def get_interval():
@@ -42,6 +50,4 @@ def get_interval():
 
 
 def set_interval_value(seconds: int):
-    data = _load()
-    data["interval"] = int(seconds)
-    _save(data)
+    _save("interval", int(seconds))
@@ -0,0 +1,54 @@
+import asyncio
+
+from aiogram import Bot, types
+from aiogram.methods import EditMessageCaption, EditMessageMedia
+
+from app.botpool import BotPool
+from app.handlers import source
+
+
+def _photo_edit(bot: Bot) -> types.Message:
+    return types.Message.model_validate({
+        "message_id": 5,
+        "date": 0,
+        "chat": {"id": -1001, "type": "channel"},
+        "photo": [{"file_id": "primary-file", "file_unique_id": "u", "width": 1, "height": 1}],
+        "caption": "new caption",
+    }).as_(bot)
+
+
+def test_sender_bot_copies_edit_caption_only(monkeypatch):
+    """file_id ربات اصلی برای ربات ارسال معتبر نیست → کپی‌های آن فقط کپشن می‌گیرند."""
+    primary = Bot("1:primary")
+    pool = BotPool()
+    pool.start(primary, ["2:sender"])
+
+    sender = next(b for b in pool.bots if b.id == 2)
+    on_primary = next(c for c in range(-200, -100) if pool.route(c)[0] is primary)
+    on_sender = next(c for c in range(-200, -100) if pool.route(c)[0] is sender)
+
+    calls = []
+
+    def fake_session(bot_name):
+        async def make_request(bot, method, timeout=None):
+            calls.append((bot_name, type(method), method.chat_id))
+            return True
+        return make_request
+
+    primary.session.make_request = fake_session("primary")
+    sender.session.make_request = fake_session("sender")
+
+    async def get_copies(source_id, message_id):
+        return {on_primary: [10], on_sender: [20, 21]}
+
+    monkeypatch.setattr(source, "POOL", pool)
+    monkeypatch.setattr(source, "get_copies", get_copies)
+
+    edited = asyncio.run(source.propagate_edit(_photo_edit(primary)))
+
+    assert edited == 3
+    assert sorted(calls, key=lambda c: (c[0], c[2])) == sorted([
+        ("primary", EditMessageMedia, on_primary),
+        ("sender", EditMessageCaption, on_sender),
+        ("sender", EditMessageCaption, on_sender),
+    ], key=lambda c: (c[0], c[2]))